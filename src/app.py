@@ -1,20 +1,50 @@
+import asyncio
+import hashlib
 import uuid
 import os
-import requests
+import httpx
 import random
+import time
+import json
+
+from email.utils import formatdate, parsedate_to_datetime
 
 from pylognet.client import LoggingClient, LogLevel
 from pydantic import BaseModel
-from concurrent.futures import ThreadPoolExecutor
-
-from fastapi import FastAPI, APIRouter, Form, UploadFile, File
-from fastapi.responses import JSONResponse, FileResponse
-
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from fastapi import (
+    FastAPI,
+    APIRouter,
+    Form,
+    UploadFile,
+    File,
+    Header,
+    Query,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
+
+from db.bundle import get_bundle_etag, iter_bundle
 from db.controller import DataBase
+from db.model import UserData
+from db.pool import SlotPool
+from db.upload import UploadBusyError, UploadManager
+from event.bus import EventBus
+from generator.client import GeneratorClient
+from job.pipeline import Pipeline
+from job.scheduler import JobScheduler, QueueFullError
 from llm.controller import LLMController, ResponseModel
+from log.buffer import BufferedLogger
+from metrics.registry import REGISTRY, MetricsMiddleware
 
 from qr.email import EmailSender
+from qr.outbox import EmailOutbox
 from qr.handler import QRHandler
+from tracing.tracer import SpanContext, Tracer
 
 
 DAIBUTSU = [
@@ -45,7 +75,39 @@ class UserRequest(BaseModel):
     request: str
 
 
+class UploadRequest(BaseModel):
+    user_id: str
+    size: int
+    chunk_size: int | None = None
+
+
+class BulkRequest(BaseModel):
+    ids: list[str]
+    params: bool = True
+
+
+class FinalizeRequest(BaseModel):
+    checksum: str
+    algorithm: str = "sha256"
+
+
 class App:
+    MAX_WATCH = 200
+    MAX_BULK = 200
+    # /create users are for testing and never go through the pipeline
+    DEBUG_EMAIL = "debuguser@debug.com"
+    RESUME_BATCH = 100
+    # assets each generator is expected to post back
+    GENERATOR_ASSETS = {
+        "model": ("image", "model"),
+        "audio": ("audio",),
+    }
+    UPLOAD_ASSETS = {
+        "image": UserData.IMAGE_FILE,
+        "model": UserData.MODEL_FILE,
+        "audio": UserData.AUDIO_FILE,
+    }
+
     def __init__(self, config: dict, debug_mode: bool = False, logging: bool = False):
         self.__debug = debug_mode
         self.__endpoints = config.get("endpoints", {})
@@ -59,26 +121,73 @@ class App:
             "logger", "http://logger.local:9000"
         )
 
-        self.__logger = LoggingClient(
-            "YummyControlServer",
-            self.__logger_endpoint,
-            disable=not logging,
+        # handlers only append to a buffer; shipping happens on a thread
+        self.__logger = BufferedLogger(
+            config,
+            LoggingClient(
+                "YummyControlServer",
+                self.__logger_endpoint,
+                disable=not logging,
+            ),
+            debug_mode,
         )
 
         self.__db = DataBase(config, self.__logger, debug_mode)
+        self.__cache_control = "public, max-age={}, immutable".format(
+            int(config.get("assets", {}).get("max_age", 31536000))
+        )
+        self.__uploads = UploadManager(config, self.__db, self.__logger, debug_mode)
+        self.__events = EventBus(config, self.__logger, debug_mode)
+        self.__db.add_listener(self.__events.publish)
         self.__llm = LLMController(config, self.__logger, debug_mode)
         self.__qr_handler = QRHandler(config, self.__logger, debug_mode)
-        self.__email_sender = EmailSender(
-            config.get("email", {}), self.__logger, debug_mode
+        self.__pool = SlotPool(
+            config, self.__db, self.__qr_handler, self.__logger, debug_mode
         )
+        self.__email_sender = EmailSender(config, self.__logger, debug_mode)
+        self.__outbox = EmailOutbox(
+            config, self.__email_sender, self.__db, self.__logger, debug_mode
+        )
+
+        self.__generator = GeneratorClient(config, self.__logger, debug_mode)
 
-        self.__executor = ThreadPoolExecutor()
-        self.__app = FastAPI()
+        self.__scheduler = JobScheduler(config, self.__logger, debug_mode)
+        self.__pipeline = Pipeline(config, self.__logger, debug_mode)
+        self.__tracer = Tracer(config, self.__db, self.__logger, debug_mode)
+        self.__pipeline.set_hooks(
+            self.__redispatch, self.__send_email, self.__fail_user
+        )
+        self.__db.add_listener(self.__on_db_event)
+        self.__resume = config.get("pipeline", {}).get("resume", {})
+        self.__resumer: asyncio.Task | None = None
+        self.__app = FastAPI(lifespan=self.__lifespan)
+        self.__app.add_middleware(MetricsMiddleware)
         self.__router = APIRouter()
         self.__setup_routes()
-
-    def __del__(self):
-        self.__executor.shutdown(True)
+        self.__setup_metrics()
+
+    @asynccontextmanager
+    async def __lifespan(self, app: FastAPI):
+        self.__scheduler.start()
+        self.__uploads.start()
+        await self.__pool.start()
+        await self.__outbox.start()
+        self.__tracer.start()
+        if self.__resume.get("enabled", False):
+            # runs alongside request handling so startup is not delayed
+            self.__resumer = asyncio.create_task(self.__resume_pending())
+        yield
+        if self.__resumer is not None:
+            self.__resumer.cancel()
+            await asyncio.gather(self.__resumer, return_exceptions=True)
+        await self.__tracer.stop()
+        await self.__outbox.stop()
+        await self.__uploads.stop()
+        await self.__pool.stop()
+        await self.__scheduler.stop()
+        await self.__generator.close()
+        await self.__db.close()
+        await asyncio.to_thread(self.__logger.close)
 
     def __setup_routes(self):
         self.__router.add_api_route(
@@ -106,6 +215,31 @@ class App:
             self.save_audio,
             methods=["POST"],
         )
+        self.__router.add_api_route(
+            "/upload/{asset}",
+            self.create_upload,
+            methods=["POST"],
+        )
+        self.__router.add_api_route(
+            "/upload/{upload_id}",
+            self.get_upload,
+            methods=["GET"],
+        )
+        self.__router.add_api_route(
+            "/upload/{upload_id}/{index}",
+            self.put_chunk,
+            methods=["PUT"],
+        )
+        self.__router.add_api_route(
+            "/upload/{upload_id}/finalize",
+            self.finalize_upload,
+            methods=["POST"],
+        )
+        self.__router.add_api_route(
+            "/upload/{upload_id}",
+            self.abort_upload,
+            methods=["DELETE"],
+        )
 
         if self.__debug:
             self.__router.add_api_route(
@@ -144,104 +278,347 @@ class App:
             self.get_param,
             methods=["GET"],
         )
+        self.__router.add_api_route(
+            "/users/bulk",
+            self.bulk_users,
+            methods=["POST"],
+        )
+        self.__router.add_api_route(
+            "/events",
+            self.events,
+            methods=["GET"],
+        )
+        self.__router.add_api_websocket_route(
+            "/ws/events",
+            self.events_ws,
+        )
+        self.__router.add_api_route(
+            "/{user_id}/bundle",
+            self.get_bundle,
+            methods=["GET"],
+        )
         self.__router.add_api_route(
             "/get-users",
             self.get_users,
             methods=["GET"],
         )
+        self.__router.add_api_route(
+            "/metrics",
+            self.metrics,
+            methods=["GET"],
+        )
+        self.__router.add_api_route(
+            "/traces",
+            self.traces,
+            methods=["GET"],
+        )
         self.__router.add_api_route(
             "/ping",
             self.ping,
             methods=["GET"],
         )
+        self.__router.add_api_route(
+            "/jobs",
+            self.jobs,
+            methods=["GET"],
+        )
+        self.__router.add_api_route(
+            "/outbox",
+            self.outbox,
+            methods=["GET"],
+        )
+        self.__router.add_api_route(
+            "/pipeline",
+            self.pipeline,
+            methods=["GET"],
+        )
+        self.__router.add_api_route(
+            "/{user_id}/pipeline",
+            self.user_pipeline,
+            methods=["GET"],
+        )
+        self.__router.add_api_route(
+            "/pool",
+            self.pool,
+            methods=["GET"],
+        )
+        self.__router.add_api_route(
+            "/llm-cache",
+            self.llm_cache,
+            methods=["GET"],
+        )
+        self.__router.add_api_route(
+            "/llm-backends",
+            self.llm_backends,
+            methods=["GET"],
+        )
 
-    def __post(self, *args, **kwargs):
-        if self.__debug:
+    def __setup_metrics(self):
+        REGISTRY.gauge(
+            "job_queue_depth",
+            "Jobs waiting in each scheduler stage",
+            lambda: {
+                (stage,): stats["depth"]
+                for stage, stats in self.__scheduler.get_stats().items()
+            },
+            ("stage",),
+        )
+        REGISTRY.gauge(
+            "job_running",
+            "Jobs running in each scheduler stage",
+            lambda: {
+                (stage,): stats["running"]
+                for stage, stats in self.__scheduler.get_stats().items()
+            },
+            ("stage",),
+        )
+        REGISTRY.gauge(
+            "users",
+            "Users by state",
+            lambda: {
+                (state,): self.__db.count_users(state) for state in UserData.STATES
+            },
+            ("state",),
+        )
+        REGISTRY.gauge(
+            "db_disk_bytes",
+            "Bytes used by user assets and free on the database filesystem",
+            lambda: {(kind,): value for kind, value in self.__db.get_disk_usage().items()},
+            ("kind",),
+        )
+        REGISTRY.gauge(
+            "email_outbox_pending",
+            "Mails waiting in the outbox",
+            self.__outbox.get_pending,
+        )
+        REGISTRY.gauge(
+            "log_records",
+            "Log records buffered, shipped, sampled out and dropped",
+            lambda: {
+                (kind,): self.__logger.get_stats()[kind]
+                for kind in ("buffered", "shipped", "sampled", "dropped")
+            },
+            ("kind",),
+        )
+        REGISTRY.gauge(
+            "pool_available",
+            "Pre-warmed user slots ready to claim",
+            lambda: self.__pool.get_stats()["available"],
+        )
+
+    def __send_email(self, user_id: str) -> bool:
+        user = self.__db.get_user(user_id)
+        if user is None or not user.get_email():
             self.__logger.log(
-                f"POST request to {args[0]} with {kwargs}",
-                LogLevel.DEBUG,
+                f"User data incomplete, skipping email for {user_id}",
+                LogLevel.ERROR,
             )
-        else:
-            requests.post(*args, **kwargs)
+            self.__tracer.end_trace(user_id, notified=False)
+            return False
 
-    def __send_email(self, user_id: str) -> JSONResponse:
-        if not self.__db.is_exist(user_id):
-            return JSONResponse(content={"detail": "UUID not found"}, status_code=404)
+        self.__outbox.enqueue(user_id, user.get_email())
+        self.__tracer.end_trace(user_id)
+        return True
 
-        user = self.__db.get_user(user_id)
-        if user is None or not user.meta.email or not user.meta.qr_code:
-            return JSONResponse(
-                content={"detail": "User data incomplete"}, status_code=500
-            )
+    async def __create_user(self, email: str, request: str) -> str:
+        # a pre-allocated slot only needs its metadata written; fall back to
+        # creating the user from scratch when the pool has run dry
+        if (generated_uuid := self.__pool.claim(email, request)) is not None:
+            return generated_uuid
 
-        to = user.meta.email
-        qr_code = user.meta.qr_code
-        self.__executor.submit(self.__email_sender.send_email, to, qr_code, user_id)
-        return JSONResponse(content={"detail": "QR Code sent successfully"})
+        generated_uuid = str(uuid.uuid4())
+        _, qr_image = await self.__qr_handler.generate(generated_uuid)
+
+        self.__db.add_user(generated_uuid)
+        await self.__db.load_qr(generated_uuid, qr_image)
+        self.__db.update_meta(generated_uuid, email, request)
+        return generated_uuid
 
-    def __call_llm(self, request: str) -> ResponseModel:
+    async def __call_llm(self, request: str) -> ResponseModel:
         self.__logger.log(
             "Calling LLM for request",
             LogLevel.INFO,
         )
-        llm_response = self.__llm.choose_dish(request)
+        llm_response = await self.__llm.choose_dish(request)
         return llm_response
 
-    def __generate_model(self, user_id: str, request: str) -> None:
+    async def __generate_model(self, user_id: str, request: str) -> None:
         self.__logger.log(
             "Calling model generator",
             LogLevel.INFO,
         )
-        data = {
-            "user_id": user_id,
-            "prompt": request,
-        }
-
-        try:
-            self.__post(f"{self.__model_endpoint}/generate", json=data)
-            self.__logger.log(
-                f"Model generation request succeeded for {user_id}",
-                LogLevel.INFO,
-            )
-        except requests.RequestException as e:
-            self.__logger.log(
-                f"Model generation request exception for {user_id}: {e}",
-                LogLevel.ERROR,
-            )
+        with self.__tracer.span("generator.model", user_id) as span:
+            # the generator continues the trace and echoes it on /save/*
+            traceparent = span.context.to_traceparent()
+            data = {
+                "user_id": user_id,
+                "prompt": request,
+                "traceparent": traceparent,
+            }
 
-    def __generate_audio(self, user_id: str, request: str) -> None:
+            try:
+                await self.__generator.post(
+                    "model",
+                    f"{self.__model_endpoint}/generate",
+                    data,
+                    headers={"traceparent": traceparent},
+                )
+                self.__logger.log(
+                    f"Model generation request succeeded for {user_id}",
+                    LogLevel.INFO,
+                )
+            except httpx.HTTPError as e:
+                span.set_attribute("error", str(e))
+                span.status = "error"
+                self.__logger.log(
+                    f"Model generation request exception for {user_id}: {e}",
+                    LogLevel.ERROR,
+                )
+                self.__pipeline.dispatch_failed(user_id, f"model generator: {e}")
+
+    async def __generate_audio(self, user_id: str, request: str) -> None:
         self.__logger.log(
             "Calling audio generator",
             LogLevel.INFO,
         )
-        data = {
-            "user_id": user_id,
-            "prompt": request,
-        }
+        with self.__tracer.span("generator.audio", user_id) as span:
+            # the generator continues the trace and echoes it on /save/*
+            traceparent = span.context.to_traceparent()
+            data = {
+                "user_id": user_id,
+                "prompt": request,
+                "traceparent": traceparent,
+            }
 
+            try:
+                await self.__generator.post(
+                    "audio",
+                    f"{self.__audio_endpoint}/generate",
+                    data,
+                    headers={"traceparent": traceparent},
+                )
+                self.__logger.log(
+                    f"Audio generation request succeeded for {user_id}",
+                    LogLevel.INFO,
+                )
+            except httpx.HTTPError as e:
+                span.set_attribute("error", str(e))
+                span.status = "error"
+                self.__logger.log(
+                    f"Audio generation request exception for {user_id}: {e}",
+                    LogLevel.ERROR,
+                )
+                self.__pipeline.dispatch_failed(user_id, f"audio generator: {e}")
+
+    async def __dispatch(
+        self, uuid: str, prompt: str, arrived: set[str] | None = None
+    ) -> None:
+        self.__pipeline.dispatched(uuid)
+        arrived = arrived or set()
+        calls = []
+        if not set(App.GENERATOR_ASSETS["model"]) <= arrived:
+            calls.append(self.__generate_model(uuid, prompt))
+        if not set(App.GENERATOR_ASSETS["audio"]) <= arrived:
+            calls.append(self.__generate_audio(uuid, prompt))
+        await asyncio.gather(*calls)
+
+    def __redispatch(self, user_id: str, prompt: str, arrived: set[str]) -> None:
         try:
-            self.__post(f"{self.__audio_endpoint}/generate", json=data)
+            self.__scheduler.submit(
+                JobScheduler.GENERATOR, self.__dispatch, user_id, prompt, arrived
+            )
+        except QueueFullError as e:
+            self.__pipeline.dispatch_failed(user_id, str(e))
+
+    def __fail_user(self, user_id: str, reason: str) -> None:
+        self.__tracer.end_trace(user_id, "error", reason=reason)
+        progress = self.__db.get_progress(user_id)
+        if progress is not None and progress["state"] != UserData.FAILED:
+            self.__db.mark_failed(user_id)
+
+    def __on_db_event(self, user_id: str, event: str, data: dict) -> None:
+        if event == "asset":
+            self.__pipeline.asset_arrived(user_id, data["asset"])
+        elif event == "ready":
+            self.__pipeline.ready(user_id)
+        elif event == "failed":
+            self.__pipeline.fail(user_id, "marked as failed")
+
+    async def __resume_pending(self) -> None:
+        # users left pending by a restart have no pipeline run; pick up the
+        # recent ones where they stopped
+        oldest = time.time() - float(self.__resume.get("max_age", 3600))
+        user_ids = [
+            user.get_uuid()
+            for user in self.__db.list_users()
+            if user.get_state() == UserData.PENDING
+            and user.get_created_at() >= oldest
+            and user.get_email() not in ("", App.DEBUG_EMAIL)
+        ]
+
+        resumed = requeued = deferred = 0
+        for i in range(0, len(user_ids), App.RESUME_BATCH):
+            summaries = await self.__db.get_summaries(
+                user_ids[i : i + App.RESUME_BATCH]
+            )
+            for user_id, summary in summaries.items():
+                if summary is None or summary["state"] != UserData.PENDING:
+                    continue
+
+                param = summary["param"]
+                if param is not None:
+                    if param.get("status") == "error":
+                        self.__db.mark_failed(user_id)
+                        continue
+                    arrived = {
+                        name for name, done in summary["assets"].items() if done
+                    }
+                    self.__pipeline.resume(
+                        user_id, param.get("translated", ""), arrived
+                    )
+                    resumed += 1
+                elif self.__scheduler.is_full(JobScheduler.LLM):
+                    # stays pending; a later restart or the client can retry
+                    deferred += 1
+                else:
+                    self.__scheduler.submit(
+                        JobScheduler.LLM, self.__generate, summary["request"], user_id
+                    )
+                    self.__pipeline.requested(user_id)
+                    requeued += 1
+
+        if user_ids:
             self.__logger.log(
-                f"Audio generation request succeeded for {user_id}",
+                f"Pending users after restart: {resumed} re-dispatched, "
+                f"{requeued} re-queued for the LLM, {deferred} left pending",
                 LogLevel.INFO,
             )
-        except requests.RequestException as e:
+
+    async def __generate(self, request: str, uuid: str) -> None:
+        self.__pipeline.llm_started(uuid)
+        llm_response: ResponseModel
+        with self.__tracer.span("llm.choose_dish", uuid) as span:
+            if self.__debug:
+                llm_response = ResponseModel()
+            else:
+                llm_response = await self.__call_llm(request)
+            span.set_attribute("status", llm_response.status)
+            if llm_response.status == "error":
+                span.status = "error"
+
+        await self.__db.load_param(uuid, llm_response.model_dump())
+        if llm_response.status == "error":
             self.__logger.log(
-                f"Audio generation request exception for {user_id}: {e}",
+                f"LLM failed for {uuid}: {llm_response.error}",
                 LogLevel.ERROR,
             )
+            self.__db.mark_failed(uuid)
+            return
 
-    def __generate(self, request: str, uuid: str) -> None:
-        llm_response: ResponseModel
-        if self.__debug:
-            llm_response = ResponseModel()
-        else:
-            llm_response = self.__call_llm(request)
-
-        self.__db.load_param(uuid, llm_response.model_dump())
-
-        self.__executor.submit(self.__generate_model, uuid, llm_response.translated)
-        self.__executor.submit(self.__generate_audio, uuid, llm_response.translated)
+        self.__pipeline.llm_done(uuid, llm_response.translated)
+        await self.__scheduler.enqueue(
+            JobScheduler.GENERATOR, self.__dispatch, uuid, llm_response.translated
+        )
 
     def get_app(self):
         self.__app.include_router(self.__router)
@@ -269,11 +646,7 @@ class App:
 
     # /create
     async def create(self) -> JSONResponse:
-        generated_uuid = str(uuid.uuid4())
-        qr_data, qr_image = self.__qr_handler.generate_qr(generated_uuid)
-
-        self.__db.add_user(generated_uuid)
-        self.__db.load_qr(generated_uuid, qr_image)
+        generated_uuid = await self.__create_user(App.DEBUG_EMAIL, "Debug request")
 
         user = self.__db.get_user(generated_uuid)
         if user is None:
@@ -281,13 +654,8 @@ class App:
                 content={"detail": "Failed to add user"}, status_code=500
             )
 
-        user.meta.email = "debuguser@debug.com"
-        user.meta.qr_code = qr_data
-        user.meta.request = "Debug request"
-        user.save_meta()
-
         self.__logger.log(
-            f"Debug user created with UUID: {generated_uuid} and request: {user.meta.request}",
+            f"Debug user created with UUID: {generated_uuid} and request: {user.get_request()}",
             LogLevel.DEBUG,
         )
 
@@ -297,28 +665,45 @@ class App:
 
     # /request
     async def request(self, request: UserRequest) -> JSONResponse:
-        generated_uuid = str(uuid.uuid4())
-        qr_data, qr_image = self.__qr_handler.generate_qr(generated_uuid)
+        if self.__scheduler.is_full(JobScheduler.LLM):
+            retry_after = self.__scheduler.get_queue(JobScheduler.LLM).get_retry_after()
+            return JSONResponse(
+                content={"detail": "Too many requests, try again later"},
+                status_code=429,
+                headers={"Retry-After": str(retry_after)},
+            )
 
-        self.__db.add_user(generated_uuid)
-        self.__db.load_qr(generated_uuid, qr_image)
+        root = self.__tracer.start_trace("request")
+        generated_uuid = await self.__create_user(request.email, request.request)
 
         user = self.__db.get_user(generated_uuid)
         if user is None:
+            root.end("error")
             return JSONResponse(
                 content={"detail": "Failed to add user"}, status_code=500
             )
 
-        user.meta.email = request.email
-        user.meta.qr_code = qr_data
-        user.meta.request = request.request
-        user.save_meta()
+        self.__tracer.bind(generated_uuid, root)
 
         self.__logger.log(
-            f"New request registered with UUID: {generated_uuid} and request: {user.meta.request}",
+            f"New request registered with UUID: {generated_uuid} and request: {user.get_request()}",
             LogLevel.INFO,
         )
-        self.__executor.submit(self.__generate, user.meta.request, generated_uuid)
+        try:
+            self.__scheduler.submit(
+                JobScheduler.LLM, self.__generate, user.get_request(), generated_uuid
+            )
+        except QueueFullError as e:
+            # the queue filled up while the user was being created; do not
+            # leave a user behind that nothing will ever generate
+            self.__db.remove_user(generated_uuid)
+            self.__tracer.end_trace(generated_uuid, "rejected")
+            return JSONResponse(
+                content={"detail": "Too many requests, try again later"},
+                status_code=429,
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        self.__pipeline.requested(generated_uuid)
 
         return JSONResponse(
             content={"detail": f"UUID:{generated_uuid}"}, status_code=201
@@ -329,6 +714,8 @@ class App:
         self,
         user_id: str = Form(...),
         file: UploadFile = File(...),
+        traceparent: str | None = Header(None),
+        form_traceparent: str | None = Form(None, alias="traceparent"),
     ) -> JSONResponse:
         if not self.__db.is_exist(user_id):
             return JSONResponse(
@@ -336,10 +723,9 @@ class App:
                 content={"message": f"User {user_id} not found."},
             )
 
-        self.__db.load_image(user_id, file)
-
-        if self.__db.is_ready(user_id):
-            self.__executor.submit(self.__send_email, user_id)
+        parent = SpanContext.from_traceparent(traceparent or form_traceparent)
+        with self.__tracer.span("save.image", user_id, parent):
+            await self.__db.load_image(user_id, file)
 
         return JSONResponse(
             {"message": f"Image file for user {uuid} saved successfully."}
@@ -350,6 +736,8 @@ class App:
         self,
         user_id: str = Form(...),
         file: UploadFile = File(...),
+        traceparent: str | None = Header(None),
+        form_traceparent: str | None = Form(None, alias="traceparent"),
     ) -> JSONResponse:
         if not self.__db.is_exist(user_id):
             return JSONResponse(
@@ -357,10 +745,9 @@ class App:
                 content={"message": f"User {user_id} not found."},
             )
 
-        self.__db.load_model(user_id, file)
-
-        if self.__db.is_ready(user_id):
-            self.__executor.submit(self.__send_email, user_id)
+        parent = SpanContext.from_traceparent(traceparent or form_traceparent)
+        with self.__tracer.span("save.model", user_id, parent):
+            await self.__db.load_model(user_id, file)
 
         return JSONResponse(
             {"message": f"Model file for user {uuid} saved successfully."}
@@ -371,6 +758,8 @@ class App:
         self,
         user_id: str = Form(...),
         file: UploadFile = File(...),
+        traceparent: str | None = Header(None),
+        form_traceparent: str | None = Form(None, alias="traceparent"),
     ) -> JSONResponse:
         if not self.__db.is_exist(user_id):
             return JSONResponse(
@@ -378,15 +767,105 @@ class App:
                 content={"message": f"User {user_id} not found."},
             )
 
-        self.__db.load_audio(user_id, file)
-
-        if self.__db.is_ready(user_id):
-            self.__executor.submit(self.__send_email, user_id)
+        parent = SpanContext.from_traceparent(traceparent or form_traceparent)
+        with self.__tracer.span("save.audio", user_id, parent):
+            await self.__db.load_audio(user_id, file)
 
         return JSONResponse(
             {"message": f"Audio file for user {uuid} saved successfully."}
         )
 
+    # /upload/{asset}
+    async def create_upload(self, asset: str, body: UploadRequest) -> JSONResponse:
+        file_type = App.UPLOAD_ASSETS.get(asset)
+        if file_type is None:
+            return JSONResponse(
+                status_code=404,
+                content={"message": f"Unknown asset {asset}."},
+            )
+
+        try:
+            session = await self.__uploads.create(
+                body.user_id, file_type, body.size, body.chunk_size
+            )
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"message": str(e)})
+
+        return JSONResponse(content=session.to_dict(), status_code=201)
+
+    # /upload/{upload_id}
+    async def get_upload(self, upload_id: str) -> JSONResponse:
+        session = self.__uploads.get(upload_id)
+        if session is None:
+            return JSONResponse(
+                status_code=404,
+                content={"message": f"Upload {upload_id} not found."},
+            )
+
+        return JSONResponse(session.to_dict())
+
+    # /upload/{upload_id}/{index}
+    async def put_chunk(self, upload_id: str, index: int, request: Request) -> JSONResponse:
+        try:
+            session = await self.__uploads.write_chunk(
+                upload_id, index, await request.body()
+            )
+        except KeyError:
+            return JSONResponse(
+                status_code=404,
+                content={"message": f"Upload {upload_id} not found."},
+            )
+        except UploadBusyError as e:
+            return JSONResponse(status_code=409, content={"message": str(e)})
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"message": str(e)})
+
+        return JSONResponse(
+            {"upload_id": upload_id, "index": index, "missing": len(session.get_missing())}
+        )
+
+    # /upload/{upload_id}/finalize
+    async def finalize_upload(self, upload_id: str, body: FinalizeRequest) -> JSONResponse:
+        session = self.__uploads.get(upload_id)
+        if session is None:
+            return JSONResponse(
+                status_code=404,
+                content={"message": f"Upload {upload_id} not found."},
+            )
+
+        try:
+            await self.__uploads.finalize(upload_id, body.checksum, body.algorithm)
+        except KeyError:
+            return JSONResponse(
+                status_code=404,
+                content={"message": f"Upload {upload_id} not found."},
+            )
+        except UploadBusyError as e:
+            return JSONResponse(status_code=409, content={"message": str(e)})
+        except ValueError as e:
+            return JSONResponse(
+                status_code=409,
+                content={"message": str(e), **session.to_dict()},
+            )
+
+        return JSONResponse(
+            {"message": f"Upload {upload_id} for user {session.user_id} saved successfully."}
+        )
+
+    # /upload/{upload_id}
+    async def abort_upload(self, upload_id: str) -> JSONResponse:
+        try:
+            aborted = await self.__uploads.abort(upload_id)
+        except UploadBusyError as e:
+            return JSONResponse(status_code=409, content={"message": str(e)})
+        if not aborted:
+            return JSONResponse(
+                status_code=404,
+                content={"message": f"Upload {upload_id} not found."},
+            )
+
+        return JSONResponse({"message": f"Upload {upload_id} aborted."})
+
     # /{user_id}/status
     async def status(self, user_id: str) -> JSONResponse:
         return JSONResponse(
@@ -396,100 +875,429 @@ class App:
             }
         )
 
-    # /{user_id}/qr
-    async def get_qr(self, user_id: str) -> FileResponse:
-        qr_path = ""
-        if (userdata := self.__db.get_user(user_id)) is not None:
-            qr_path = userdata.get_qr_path()
-        else:
-            return FileResponse("./dummy", status_code=404)
+    def __not_modified(self, request: Request, etag: str, mtime: float) -> bool:
+        if (if_none_match := request.headers.get("if-none-match")) is not None:
+            # If-None-Match uses the weak comparison
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or etag.removeprefix("W/") in tags
+
+        if (if_modified_since := request.headers.get("if-modified-since")) is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(mtime) <= since
+
+        return False
+
+    def __cache_headers(self, etag: str, mtime: float, weak: bool = False) -> dict:
+        """
+        Validators and caching headers shared by every cacheable download.
+        """
+        return {
+            "etag": f'W/"{etag}"' if weak else f'"{etag}"',
+            "last-modified": formatdate(mtime, usegmt=True),
+            "cache-control": self.__cache_control,
+        }
 
-        if not qr_path or not os.path.exists(qr_path):
-            return FileResponse("./dummy", status_code=404)
+    async def __serve_asset(
+        self, request: Request, user_id: str, file_type: str, media_type: str
+    ) -> Response:
+        """
+        Serve a stored asset with validators and caching headers.
+
+        Assets never change in place for a UUID (a re-upload replaces the
+        file and its checksum), so the stored checksum is used as a strong
+        ETag and clients may cache for `assets.max_age`. Conditional
+        requests are answered with 304, and FileResponse takes care of
+        Range/If-Range and 206 partial responses. When the client accepts
+        it, a precompressed variant is sent with its own ETag.
+
+        Args:
+            request (Request): The incoming request.
+            user_id (str): The user's UUID.
+            file_type (str): One of UserData.FILES.
+            media_type (str): Content type of the asset.
+
+        Returns:
+            Response: The file, a 304 or a 404 response.
+        """
+        if (userdata := self.__db.get_user(user_id)) is None:
+            return JSONResponse(
+                status_code=404,
+                content={"message": f"User {user_id} not found."},
+            )
 
-        return FileResponse(
-            qr_path, media_type="image/png", filename=os.path.basename(qr_path)
-        )
+        path = userdata.get_asset_path(file_type)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return JSONResponse(
+                status_code=404,
+                content={"message": f"{file_type} for user {user_id} not found."},
+            )
 
-    # /{user_id}/image
-    async def get_image(self, user_id: str) -> FileResponse:
-        image_path = ""
-        if (userdata := self.__db.get_user(user_id)) is not None:
-            image_path = userdata.get_image_path()
+        if checksum := userdata.get_checksum(file_type):
+            etag = checksum
         else:
-            return FileResponse("./dummy", status_code=404)
+            etag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
 
-        if not image_path or not os.path.exists(image_path):
-            return FileResponse("./dummy", status_code=404)
+        mtime = stat.st_mtime
+        headers = {}
+        encodings = self.__db.negotiate_encodings(
+            file_type, request.headers.get("accept-encoding", "")
+        )
+        if self.__db.is_compressible(file_type):
+            headers["vary"] = "Accept-Encoding"
+        for encoding in encodings:
+            variant_path = userdata.get_variant_path(file_type, encoding)
+            try:
+                variant_stat = os.stat(variant_path)
+            except FileNotFoundError:
+                continue
+            # the variant is only valid if it is not older than the asset
+            if variant_stat.st_mtime_ns < stat.st_mtime_ns:
+                continue
+            path, stat = variant_path, variant_stat
+            etag = f"{etag}-{encoding}"
+            headers["content-encoding"] = encoding
+            break
+        headers.update(self.__cache_headers(etag, mtime))
+
+        if self.__not_modified(request, headers["etag"], mtime):
+            return Response(status_code=304, headers=headers)
 
         return FileResponse(
-            image_path, media_type="image/png", filename=os.path.basename(image_path)
+            path,
+            media_type=media_type,
+            filename=file_type,
+            headers=headers,
+            stat_result=stat,
         )
 
-    # /{user_id}/model
-    async def get_model(self, user_id: str) -> FileResponse:
-        model_path = ""
-        if (userdata := self.__db.get_user(user_id)) is not None:
-            model_path = userdata.get_model_path()
-        else:
-            return FileResponse("./dummy", status_code=404)
-
-        if not model_path or not os.path.exists(model_path):
-            return FileResponse("./dummy", status_code=404)
+    # /{user_id}/qr
+    async def get_qr(
+        self, user_id: str, request: Request, fmt: str = Query("png", alias="format")
+    ) -> Response:
+        if fmt == "svg":
+            if (userdata := self.__db.get_user(user_id)) is None:
+                return JSONResponse(
+                    status_code=404,
+                    content={"message": f"User {user_id} not found."},
+                )
+            svg = await asyncio.to_thread(self.__qr_handler.render_svg, user_id)
+            # the SVG is rendered on demand, so its tag comes from the content
+            etag = hashlib.blake2b(svg.encode("utf-8"), digest_size=16).hexdigest()
+            headers = self.__cache_headers(etag, userdata.get_created_at())
+            if self.__not_modified(request, headers["etag"], userdata.get_created_at()):
+                return Response(status_code=304, headers=headers)
+            return Response(svg, media_type="image/svg+xml", headers=headers)
+        if fmt != "png":
+            return JSONResponse(
+                status_code=400,
+                content={"message": "format must be png or svg"},
+            )
 
-        return FileResponse(
-            model_path,
-            media_type="application/octet-stream",
-            filename=os.path.basename(model_path),
+        return await self.__serve_asset(
+            request, user_id, UserData.QR_FILE, "image/png"
         )
 
-    # /{user_id}/audio
-    async def get_audio(self, user_id: str) -> FileResponse:
-        audio_path = ""
-        if (userdata := self.__db.get_user(user_id)) is not None:
-            audio_path = userdata.get_audio_path()
-        else:
-            return FileResponse("./dummy", status_code=404)
+    # /{user_id}/image
+    async def get_image(self, user_id: str, request: Request) -> Response:
+        return await self.__serve_asset(
+            request, user_id, UserData.IMAGE_FILE, "image/png"
+        )
 
-        if not audio_path or not os.path.exists(audio_path):
-            return FileResponse("./dummy", status_code=404)
+    # /{user_id}/model
+    async def get_model(self, user_id: str, request: Request) -> Response:
+        return await self.__serve_asset(
+            request, user_id, UserData.MODEL_FILE, "application/octet-stream"
+        )
 
-        return FileResponse(
-            audio_path, media_type="audio/wav", filename=os.path.basename(audio_path)
+    # /{user_id}/audio
+    async def get_audio(self, user_id: str, request: Request) -> Response:
+        return await self.__serve_asset(
+            request, user_id, UserData.AUDIO_FILE, "audio/wav"
         )
 
     # /{user_id}/param
-    async def get_param(self, user_id: str) -> FileResponse:
-        param_path = ""
-        if (userdata := self.__db.get_user(user_id)) is not None:
-            param_path = userdata.get_param_path()
+    async def get_param(self, user_id: str, request: Request) -> Response:
+        return await self.__serve_asset(
+            request, user_id, UserData.PARAM_FILE, "application/json"
+        )
+
+    # /{user_id}/bundle
+    async def get_bundle(
+        self, user_id: str, request: Request, assets: str | None = None
+    ) -> Response:
+        if (userdata := self.__db.get_user(user_id)) is None:
+            return JSONResponse(
+                status_code=404,
+                content={"message": f"User {user_id} not found."},
+            )
+
+        if assets is None:
+            selected = set(UserData.ASSET_NAMES.values())
         else:
-            return FileResponse("./dummy", status_code=404)
+            selected = {name.strip() for name in assets.split(",") if name.strip()}
+            if unknown := selected - set(UserData.ASSET_NAMES.values()):
+                return JSONResponse(
+                    status_code=400,
+                    content={"message": f"Unknown assets: {sorted(unknown)}"},
+                )
+
+        progress = userdata.get_progress()
+        file_types = [
+            file_type
+            for file_type, name in UserData.ASSET_NAMES.items()
+            if name in selected and progress[name]
+        ]
+        if not file_types:
+            return JSONResponse(
+                status_code=404,
+                content={"message": f"No assets available for user {user_id}."},
+            )
 
-        if not param_path or not os.path.exists(param_path):
-            return FileResponse("./dummy", status_code=404)
+        stat = None
+        if len(file_types) == len(UserData.FILES):
+            try:
+                stat = os.stat(userdata.get_bundle_path())
+            except FileNotFoundError:
+                pass
+
+        # only the prebuilt file is byte-for-byte stable
+        headers = self.__cache_headers(
+            get_bundle_etag(userdata, file_types),
+            userdata.get_updated_at(),
+            weak=stat is None,
+        )
+        if self.__not_modified(request, headers["etag"], userdata.get_updated_at()):
+            return Response(status_code=304, headers=headers)
+
+        if stat is not None:
+            return FileResponse(
+                userdata.get_bundle_path(),
+                media_type="application/zip",
+                filename=f"{user_id}.zip",
+                headers=headers,
+                stat_result=stat,
+            )
 
-        return FileResponse(
-            param_path,
-            media_type="application/json",
-            filename=os.path.basename(param_path),
+        headers["content-disposition"] = f'attachment; filename="{user_id}.zip"'
+        return StreamingResponse(
+            iter_bundle(userdata, file_types),
+            media_type="application/zip",
+            headers=headers,
         )
 
     # /get-users
-    async def get_users(self, n: int = 10) -> JSONResponse:
-        users = self.__db.list_users()[-n:][::-1]
+    async def get_users(
+        self,
+        n: int = 10,
+        after: str | None = None,
+        before: str | None = None,
+        state: str | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        q: str | None = None,
+    ) -> JSONResponse:
+        if state is not None and state not in UserData.STATES:
+            return JSONResponse(
+                content={"detail": f"state must be one of {list(UserData.STATES)}"},
+                status_code=400,
+            )
+        if after is not None and before is not None:
+            return JSONResponse(
+                content={"detail": "after and before are mutually exclusive"},
+                status_code=400,
+            )
+
+        try:
+            users, has_more = self.__db.query_users(
+                max(1, min(n, 100)), after, before, state, since, until, q
+            )
+        except ValueError as e:
+            return JSONResponse(content={"detail": str(e)}, status_code=400)
         result = [
             {
                 "uuid": user.get_uuid(),
-                "status": self.__db.is_ready(user.get_uuid()),
-                "request": user.meta.request,
+                "cursor": self.__db.get_cursor(user.get_uuid()),
+                "status": user.get_state() == UserData.READY,
+                "state": user.get_state(),
+                "request": user.get_request(),
+                "created_at": user.get_created_at(),
                 # For privacy, do not expose email
-                # "email": user.meta.email,
+                # "email": user.get_email(),
             }
             for user in users
         ]
-        return JSONResponse(content={"users": result}, status_code=200)
+
+        older = has_more if before is None else bool(result)
+        newer = has_more if before is not None else after is not None and bool(result)
+        return JSONResponse(
+            content={
+                "users": result,
+                "total": self.__db.count_users(state),
+                "next": result[-1]["cursor"] if older and result else None,
+                "prev": result[0]["cursor"] if newer and result else None,
+            },
+            status_code=200,
+        )
+
+    # /users/bulk
+    async def bulk_users(self, body: BulkRequest) -> JSONResponse:
+        user_ids = list(dict.fromkeys(body.ids))
+        if len(user_ids) > App.MAX_BULK:
+            return JSONResponse(
+                content={"detail": f"At most {App.MAX_BULK} ids per request"},
+                status_code=400,
+            )
+
+        summaries = await self.__db.get_summaries(user_ids, body.params)
+        return JSONResponse(
+            content={
+                "users": {
+                    user_id: summary
+                    for user_id, summary in summaries.items()
+                    if summary is not None
+                },
+                "missing": [
+                    user_id for user_id, summary in summaries.items() if summary is None
+                ],
+            },
+            status_code=200,
+        )
+
+    @staticmethod
+    def __parse_ids(ids: str | None) -> list[str] | None:
+        if ids is None:
+            return None
+
+        return list(dict.fromkeys(i.strip() for i in ids.split(",") if i.strip()))
+
+    async def __watch(self, user_ids: list[str] | None) -> AsyncIterator[dict | None]:
+        """
+        Progress events for the given users, or for everyone if None.
+
+        The current status of each requested user is sent first so clients
+        cannot miss a transition that happened before they connected. When
+        specific users are watched, the stream ends once all of them are
+        ready, failed or removed. None is yielded when nothing happened
+        within the keepalive interval.
+        """
+        subscription = self.__events.subscribe(user_ids)
+        try:
+            pending = set()
+            for user_id in user_ids or []:
+                if (progress := self.__db.get_progress(user_id)) is None:
+                    yield self.__events.make_event(user_id, "unknown", {})
+                    continue
+
+                yield self.__events.make_event(user_id, "status", progress)
+                if progress["state"] == UserData.PENDING:
+                    pending.add(user_id)
+
+            if user_ids is not None and not pending:
+                return
+
+            while True:
+                event = await subscription.get(self.__events.get_keepalive())
+                yield event
+                if user_ids is None or event is None:
+                    continue
+
+                if event["event"] in EventBus.TERMINAL:
+                    pending.discard(event["uuid"])
+                    if not pending:
+                        return
+        finally:
+            self.__events.unsubscribe(subscription)
+
+    # /events
+    async def events(self, ids: str | None = None) -> Response:
+        user_ids = self.__parse_ids(ids)
+        if user_ids is not None and len(user_ids) > App.MAX_WATCH:
+            return JSONResponse(
+                content={"detail": f"At most {App.MAX_WATCH} ids can be watched"},
+                status_code=400,
+            )
+
+        async def stream() -> AsyncIterator[str]:
+            async for event in self.__watch(user_ids):
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+        return StreamingResponse(
+            stream(),
+            media_type="text/event-stream",
+            headers={"cache-control": "no-cache", "x-accel-buffering": "no"},
+        )
+
+    # /ws/events
+    async def events_ws(self, websocket: WebSocket, ids: str | None = None) -> None:
+        user_ids = self.__parse_ids(ids)
+        if user_ids is not None and len(user_ids) > App.MAX_WATCH:
+            await websocket.close(code=1008)
+            return
+
+        await websocket.accept()
+        try:
+            async for event in self.__watch(user_ids):
+                await websocket.send_json(event or {"event": "keepalive"})
+            await websocket.close()
+        except WebSocketDisconnect:
+            pass
+
+    # /metrics
+    async def metrics(self) -> Response:
+        return Response(
+            content=REGISTRY.render(), media_type="text/plain; version=0.0.4"
+        )
 
     # /ping
     async def ping(self) -> JSONResponse:
         return JSONResponse(content={"message": "pong"}, status_code=200)
+
+    # /jobs
+    async def jobs(self) -> JSONResponse:
+        return JSONResponse(content=self.__scheduler.get_stats(), status_code=200)
+
+    # /outbox
+    async def outbox(self) -> JSONResponse:
+        return JSONResponse(
+            content=await self.__outbox.get_stats(), status_code=200
+        )
+
+    # /pipeline
+    async def pipeline(self) -> JSONResponse:
+        return JSONResponse(content=self.__pipeline.get_stats(), status_code=200)
+
+    # /{user_id}/pipeline
+    async def user_pipeline(self, user_id: str) -> JSONResponse:
+        if (run := self.__pipeline.get(user_id)) is None:
+            return JSONResponse(
+                status_code=404,
+                content={"message": f"No pipeline run for user {user_id}."},
+            )
+
+        return JSONResponse(content=run, status_code=200)
+
+    # /traces
+    async def traces(self) -> JSONResponse:
+        return JSONResponse(content=self.__tracer.get_stats(), status_code=200)
+
+    # /pool
+    async def pool(self) -> JSONResponse:
+        return JSONResponse(content=self.__pool.get_stats(), status_code=200)
+
+    # /llm-cache
+    async def llm_cache(self) -> JSONResponse:
+        return JSONResponse(content=self.__llm.get_cache_stats(), status_code=200)
+
+    # /llm-backends
+    async def llm_backends(self) -> JSONResponse:
+        return JSONResponse(
+            content=self.__llm.get_dispatcher_stats(), status_code=200
+        )
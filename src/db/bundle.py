@@ -0,0 +1,95 @@
+import hashlib
+import os
+import tempfile
+import zipfile
+from typing import Iterator
+
+from db.model import UserData
+
+
+class _Sink:
+    """
+    Write-only file object that hands written bytes back to the caller,
+    letting zipfile produce an archive incrementally.
+    """
+
+    def __init__(self) -> None:
+        self.__chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.__chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> Iterator[bytes]:
+        if self.__chunks:
+            data = b"".join(self.__chunks)
+            self.__chunks.clear()
+            yield data
+
+
+def iter_bundle(user_data: UserData, file_types: list[str]) -> Iterator[bytes]:
+    """
+    Stream an uncompressed zip of the given assets straight from disk.
+
+    Entries are stored rather than deflated: PNG and GLB are already
+    compact and the point is to avoid per-download CPU work. Blocks on disk
+    I/O; StreamingResponse iterates it in a worker thread.
+
+    Args:
+        user_data (UserData): Owner of the assets.
+        file_types (list[str]): Assets to include, all of which must exist.
+
+    Yields:
+        bytes: Consecutive pieces of the archive.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as archive:
+        for file_type in file_types:
+            path = user_data.get_asset_path(file_type)
+            info = zipfile.ZipInfo.from_file(path, file_type)
+            with (
+                open(path, "rb") as source,
+                archive.open(info, "w", force_zip64=info.file_size > zipfile.ZIP64_LIMIT) as target,
+            ):
+                while chunk := source.read(UserData.BUFFER_SIZE):
+                    target.write(chunk)
+                    yield from sink.drain()
+    yield from sink.drain()
+
+
+def get_bundle_etag(user_data: UserData, file_types: list[str]) -> str:
+    """
+    ETag of a bundle, derived from the checksums of its entries. Only the
+    prebuilt file may carry it as a strong tag; archives streamed on the fly
+    are merely equivalent and must mark it weak.
+    """
+    sizes = user_data.get_sizes()
+    digest = hashlib.blake2b(digest_size=16)
+    for file_type in file_types:
+        checksum = user_data.get_checksum(file_type) or str(sizes.get(file_type, 0))
+        digest.update(f"{file_type}:{checksum};".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def build_bundle(user_data: UserData) -> None:
+    """
+    Prebuild the bundle of all assets next to them so complete downloads
+    can be served as a plain file. Blocks on disk I/O.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=user_data.get_user_path(), prefix=f".{UserData.BUNDLE_FILE}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in iter_bundle(user_data, list(UserData.FILES)):
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, user_data.get_bundle_path())
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
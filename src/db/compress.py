@@ -0,0 +1,211 @@
+import gzip
+import hashlib
+import os
+import tempfile
+
+from pylognet.client import LoggingClient, LogLevel
+
+from db.model import UserData
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class _SizeLimitExceeded(Exception):
+    pass
+
+
+class _SizeLimitedWriter:
+    """
+    File wrapper that counts the bytes written through it and raises
+    `_SizeLimitExceeded` once they pass `limit`.
+    """
+
+    def __init__(self, f, limit: int) -> None:
+        self.__f = f
+        self.__limit = limit
+        self.__size = 0
+
+    def write(self, data: bytes) -> int:
+        self.__size += len(data)
+        if self.__size > self.__limit:
+            raise _SizeLimitExceeded()
+        return self.__f.write(data)
+
+    def flush(self) -> None:
+        self.__f.flush()
+
+
+class AssetCompressor:
+    """
+    Produces precompressed variants (`model.glb.gz`, `.zst`, `.br`) next to
+    committed assets so downloads can be served with a Content-Encoding
+    without compressing per request.
+
+    gzip is always available; zstd and brotli are used when the optional
+    `zstandard` / `brotli` packages are installed.
+    """
+
+    FILES = (UserData.MODEL_FILE, UserData.AUDIO_FILE, UserData.PARAM_FILE)
+
+    def __init__(
+        self,
+        config: dict,
+        logger: LoggingClient,
+        debug_mode: bool = False,
+    ) -> None:
+        self.__debug = debug_mode
+        self.__logger = logger
+        self.__config = config.get("db", {}).get("compression", {})
+        self.__enabled = bool(self.__config.get("enabled", True))
+        self.__min_size = int(self.__config.get("min_size", 1024))
+        # a variant is only kept when it saves at least this fraction
+        self.__min_ratio = float(self.__config.get("min_ratio", 0.9))
+        self.__levels = {
+            "gzip": 6,
+            "zstd": 10,
+            "br": 9,
+            **self.__config.get("levels", {}),
+        }
+
+        available = ["gzip"]
+        if zstandard is not None:
+            available.append("zstd")
+        if brotli is not None:
+            available.append("br")
+        requested = self.__config.get("encodings", ["br", "zstd", "gzip"])
+        # server preference order, used to break ties between equal q-values
+        self.__encodings = [e for e in requested if e in available]
+
+    def is_enabled(self) -> bool:
+        return self.__enabled and bool(self.__encodings)
+
+    def is_compressible(self, file_type: str) -> bool:
+        return self.is_enabled() and file_type in AssetCompressor.FILES
+
+    def __checksum(self, path: str) -> tuple[int, str]:
+        size = 0
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            while chunk := f.read(UserData.BUFFER_SIZE):
+                size += len(chunk)
+                digest.update(chunk)
+        return size, digest.hexdigest()
+
+    def __stream(self, encoding: str, source, sink: _SizeLimitedWriter) -> None:
+        level = int(self.__levels[encoding])
+        if encoding == "gzip":
+            # mtime=0 keeps the output deterministic
+            with gzip.GzipFile(
+                fileobj=sink, mode="wb", compresslevel=level, mtime=0
+            ) as writer:
+                while chunk := source.read(UserData.BUFFER_SIZE):
+                    writer.write(chunk)
+        elif encoding == "zstd":
+            compressor = zstandard.ZstdCompressor(level=level)
+            with compressor.stream_writer(sink, closefd=False) as writer:
+                while chunk := source.read(UserData.BUFFER_SIZE):
+                    writer.write(chunk)
+        else:
+            compressor = brotli.Compressor(quality=level)
+            while chunk := source.read(UserData.BUFFER_SIZE):
+                sink.write(compressor.process(chunk))
+            sink.write(compressor.finish())
+
+    def __write_variant(
+        self, user_data: UserData, file_type: str, encoding: str, limit: int
+    ) -> bool:
+        fd, tmp_path = tempfile.mkstemp(
+            dir=user_data.get_user_path(), prefix=f".{file_type}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f, open(
+                user_data.get_asset_path(file_type), "rb"
+            ) as source:
+                try:
+                    self.__stream(encoding, source, _SizeLimitedWriter(f, limit))
+                except _SizeLimitExceeded:
+                    os.remove(tmp_path)
+                    return False
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, user_data.get_variant_path(file_type, encoding))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return True
+
+    def compress(self, user_data: UserData, file_type: str, checksum: str) -> list[str]:
+        """
+        Write all enabled variants of a committed asset. The asset is
+        streamed in `UserData.BUFFER_SIZE` blocks, and a variant is
+        abandoned as soon as its output grows past the size it has to beat.
+        This blocks on CPU and disk and is meant to run off the event loop.
+
+        Args:
+            user_data (UserData): Owner of the asset.
+            file_type (str): One of AssetCompressor.FILES.
+            checksum (str): Checksum the asset was committed with; nothing is
+                written if the file has been replaced since.
+
+        Returns:
+            list[str]: The encodings written.
+        """
+        size, digest = self.__checksum(user_data.get_asset_path(file_type))
+        if size < self.__min_size or digest != checksum:
+            return []
+
+        limit = int(size * self.__min_ratio)
+        written = [
+            encoding
+            for encoding in self.__encodings
+            if self.__write_variant(user_data, file_type, encoding, limit)
+        ]
+
+        if self.__debug:
+            self.__logger.log(
+                f"Compressed {file_type} for {user_data.get_uuid()}: {written}",
+                LogLevel.DEBUG,
+            )
+        return written
+
+    def negotiate(self, accept_encoding: str) -> list[str]:
+        """
+        Order the enabled encodings by the client's Accept-Encoding
+        preferences.
+
+        Args:
+            accept_encoding (str): The Accept-Encoding request header.
+
+        Returns:
+            list[str]: Acceptable encodings, most preferred first.
+        """
+        weights: dict[str, float] = {}
+        for item in accept_encoding.split(","):
+            name, _, params = item.strip().partition(";")
+            name = name.strip().lower()
+            if not name:
+                continue
+            q = 1.0
+            params = params.strip()
+            if params.startswith("q="):
+                try:
+                    q = float(params[2:])
+                except ValueError:
+                    q = 0.0
+            weights[name] = q
+
+        wildcard = weights.get("*", 0.0)
+        ranked = [
+            (weights.get(encoding, wildcard), -i, encoding)
+            for i, encoding in enumerate(self.__encodings)
+        ]
+        return [encoding for q, _, encoding in sorted(ranked, reverse=True) if q > 0]
@@ -1,11 +1,31 @@
+from collections import OrderedDict
 from io import BytesIO
-from pylognet.client import LoggingClient
+from pylognet.client import LoggingClient, LogLevel
+from typing import BinaryIO, Callable
+import asyncio
+import json
 import shutil
 import os
+import time
+import uuid
 
 from fastapi import UploadFile
 
+from db.bundle import build_bundle
+from db.compress import AssetCompressor
+from db.index import UserIndex
+from db.manifest import Manifest
 from db.model import UserData
+from db.record import UserRecord
+from db.sqlite import SQLiteStore
+from db.store import MetaStore
+from metrics.registry import REGISTRY
+
+ASSET_WRITE_SECONDS = REGISTRY.histogram(
+    "db_asset_write_seconds",
+    "Time to stream, fsync and install an asset, by asset",
+    ("asset",),
+)
 
 
 class DataBase:
@@ -20,32 +40,143 @@ class DataBase:
         self.__config = config.get("db", {})
         db_path = self.__config.get("path", "~/YummyVerse")
         self.__db_path = os.path.expanduser(db_path)
+        # "mtime" rescans directories changed behind our back, "names" only
+        # picks up added/removed directories
+        self.__reconcile = self.__config.get("reconcile", "mtime")
         self.__tables: dict[str, UserData] = {}
+        self.__index = UserIndex(UserData.STATES)
+        self.__listeners: list[Callable[[str, str, dict], None]] = []
+        # parsed params.json of recently active users, so bulk queries do
+        # not have to read them back from disk
+        self.__params: OrderedDict[str, dict] = OrderedDict()
+        self.__param_cache_size = int(self.__config.get("param_cache", 4096))
+        self.__compressor = AssetCompressor(config, logger, debug_mode)
+        # compression and bundle builds share a small pool of slots
+        self.__background: set[asyncio.Task] = set()
+        self.__prebuild_bundle = bool(self.__config.get("bundle", True))
+        self.__background_slots = asyncio.Semaphore(
+            int(self.__config.get("compression", {}).get("concurrency", 2))
+        )
 
         os.makedirs(self.__db_path, exist_ok=True)
+        self.__store = self.__get_store()
         self.__load_tables()
 
+    def __del__(self):
+        self.__store.close()
+
+    def get_path(self) -> str:
+        return self.__db_path
+
+    def __get_store(self) -> MetaStore:
+        backend = self.__config.get("backend", "manifest")
+        if backend == "sqlite":
+            return SQLiteStore(self.__db_path, self.__logger)
+        if backend != "manifest":
+            raise ValueError(f"Unknown DB backend: {backend}")
+        return Manifest(self.__db_path, self.__logger)
+
+    @staticmethod
+    def __is_user_id(name: str) -> bool:
+        try:
+            uuid.UUID(name)
+            return True
+        except ValueError:
+            return False
+
+    def __restore_user(self, record: UserRecord) -> UserData:
+        user_data = UserData(record.uuid, self.__db_path, create=False)
+        user_data.set_status_bits(record.status)
+        user_data.set_meta(record.email, record.request)
+        user_data.set_sizes(record.sizes)
+        user_data.set_checksums(record.checksums)
+        user_data.set_timestamps(record.created_at, record.updated_at)
+        return user_data
+
+    def __scan_user(self, dir_entry: os.DirEntry, record: UserRecord | None) -> UserData:
+        if record is not None:
+            user_data = self.__restore_user(record)
+        else:
+            user_data = UserData(dir_entry.name, self.__db_path, create=False)
+            self.__store.load_meta(user_data)
+            stat = dir_entry.stat()
+            user_data.set_timestamps(stat.st_ctime, stat.st_mtime)
+
+        user_data.scan_files()
+        return user_data
+
+    def __add(self, user_data: UserData) -> None:
+        self.__tables[user_data.get_uuid()] = user_data
+        self.__index.add(
+            user_data.get_uuid(), user_data.get_state(), user_data.get_created_at()
+        )
+
+    def __sync(self, user_id: str, previous_state: str | None = None) -> None:
+        user_data = self.__tables[user_id]
+        if previous_state is not None:
+            self.__index.move(previous_state, user_data.get_state())
+
+        try:
+            mtime = os.stat(user_data.get_user_path()).st_mtime_ns
+        except FileNotFoundError:
+            mtime = 0
+
+        updated_at = time.time()
+        user_data.set_timestamps(user_data.get_created_at(), updated_at)
+        self.__store.update(
+            UserRecord(
+                user_id,
+                user_data.get_status_bits(),
+                user_data.get_request(),
+                user_data.get_email(),
+                mtime,
+                user_data.get_created_at(),
+                updated_at,
+                user_data.get_sizes(),
+                user_data.get_checksums(),
+            )
+        )
+
     def __load_tables(self) -> None:
-        for user_id in os.listdir(self.__db_path):
-            try:
-                self.__tables[user_id] = UserData(user_id, self.__db_path)
-            except ValueError:
+        records = self.__store.load()
+        on_disk: dict[str, os.DirEntry] = {}
+        with os.scandir(self.__db_path) as it:
+            for entry in it:
+                if entry.is_dir() and self.__is_user_id(entry.name):
+                    on_disk[entry.name] = entry
+
+        for user_id, record in records.items():
+            dir_entry = on_disk.get(user_id)
+            if dir_entry is None:
+                self.__store.remove(user_id)
+                continue
+
+            if (
+                self.__reconcile == "mtime"
+                and dir_entry.stat().st_mtime_ns != record.mtime
+            ):
+                self.__add(self.__scan_user(dir_entry, record))
+                self.__sync(user_id)
                 continue
 
-        for user_id, user_data in self.__tables.items():
-            if os.path.exists(user_data.get_meta_path()):
-                user_data.load_meta()
-
-            if os.path.exists(user_data.get_qr_path()):
-                user_data.set_status(UserData.QR_FILE, True)
-            if os.path.exists(user_data.get_image_path()):
-                user_data.set_status(UserData.IMAGE_FILE, True)
-            if os.path.exists(user_data.get_model_path()):
-                user_data.set_status(UserData.MODEL_FILE, True)
-            if os.path.exists(user_data.get_audio_path()):
-                user_data.set_status(UserData.AUDIO_FILE, True)
-            if os.path.exists(user_data.get_param_path()):
-                user_data.set_status(UserData.PARAM_FILE, True)
+            self.__add(self.__restore_user(record))
+
+        # directories unknown to the index, e.g. from before it existed
+        unknown = [on_disk[user_id] for user_id in on_disk.keys() - records.keys()]
+        for dir_entry in sorted(unknown, key=lambda entry: entry.stat().st_mtime):
+            self.__add(self.__scan_user(dir_entry, None))
+            self.__sync(dir_entry.name)
+
+        self.__logger.log(
+            f"Loaded {len(self.__tables)} users ({len(records)} from index)",
+            LogLevel.INFO,
+        )
+
+    def __get(self, user_id: str) -> UserData:
+        if user_id not in self.__tables.keys():
+            raise ValueError(f"User {user_id} not found in database.")
+
+        return self.__tables[user_id]
 
     def get_user(self, user_id: str) -> UserData | None:
         if user_id not in self.__tables.keys():
@@ -58,10 +189,14 @@ class DataBase:
             return False
 
         user_data = self.__tables[user_id]
+        self.__index.remove(user_id, user_data.get_state())
         user_data.remove_all_files()
         shutil.rmtree(user_data.get_user_path(), ignore_errors=True)
 
         del self.__tables[user_id]
+        self.__params.pop(user_id, None)
+        self.__store.remove(user_id)
+        self.__notify(user_id, "removed", {})
 
         return True
 
@@ -72,7 +207,7 @@ class DataBase:
         if user_id not in self.__tables.keys():
             return False
 
-        return self.__tables[user_id].is_ready()
+        return self.__tables[user_id].get_state() == UserData.READY
 
     def add_user(self, user_id: str):
         if user_id in self.__tables.keys():
@@ -80,37 +215,384 @@ class DataBase:
 
         user_data = UserData(user_id, self.__db_path)
 
-        self.__tables[user_id] = user_data
+        self.__add(user_data)
+        self.__sync(user_id)
+
+    def adopt_user(
+        self,
+        user_id: str,
+        slot_path: str,
+        qr_size: int,
+        qr_checksum: str,
+        email: str,
+        request: str,
+    ) -> None:
+        """
+        Register a user from a pre-allocated directory that already holds
+        its QR code, moving it into the database with a single rename.
+
+        Args:
+            user_id (str): UUID of the slot.
+            slot_path (str): The slot directory on the same file system.
+            qr_size (int): Size of its qr.png.
+            qr_checksum (str): BLAKE2b checksum of its qr.png.
+            email (str): The user's email address.
+            request (str): The user's request.
+        """
+        user_data = UserData(user_id, self.__db_path, create=False)
+        os.rename(slot_path, user_data.get_user_path())
+
+        now = time.time()
+        user_data.set_timestamps(now, now)
+        user_data.set_meta(email, request)
+        user_data.commit_asset(UserData.QR_FILE, qr_size, qr_checksum)
+        self.__add(user_data)
+        self.__store.save_meta(user_data)
+        self.__sync(user_id)
+
+    def update_meta(self, user_id: str, email: str, request: str) -> None:
+        user_data = self.__get(user_id)
+        user_data.set_meta(email, request)
+        self.__store.save_meta(user_data)
+        self.__sync(user_id)
+
+    def add_listener(self, listener: Callable[[str, str, dict], None]) -> None:
+        """
+        Register a callback invoked as `listener(user_id, event, data)` on the
+        event loop whenever an asset is committed ("asset"), a user becomes
+        ready ("ready"), is marked as failed ("failed") or is removed
+        ("removed").
+        """
+        self.__listeners.append(listener)
+
+    def __notify(self, user_id: str, event: str, data: dict) -> None:
+        for listener in self.__listeners:
+            try:
+                listener(user_id, event, data)
+            except Exception as e:
+                self.__logger.log(
+                    f"Event listener failed for {user_id}: {e}", LogLevel.ERROR
+                )
+
+    def get_progress(self, user_id: str) -> dict | None:
+        """
+        Current per-asset status of a user, in the same shape as events.
+        """
+        if (user_data := self.__tables.get(user_id)) is None:
+            return None
+
+        return {
+            "state": user_data.get_state(),
+            "assets": user_data.get_progress(),
+        }
+
+    def mark_failed(self, user_id: str, failed: bool = True) -> None:
+        user_data = self.__get(user_id)
+        state = user_data.get_state()
+        user_data.set_failed(failed)
+        self.__sync(user_id, state)
+        if failed and state != UserData.FAILED:
+            self.__notify(user_id, "failed", self.get_progress(user_id))
+
+    def count_users(self, state: str | None = None) -> int:
+        """
+        Count users, optionally only those in the given state.
+
+        Args:
+            state (str | None): One of UserData.STATES, or None for all users.
+        """
+        return self.__index.count(state)
+
+    def get_cursor(self, user_id: str) -> str | None:
+        return self.__index.get_cursor(user_id)
+
+    def query_users(
+        self,
+        limit: int = 10,
+        after: str | None = None,
+        before: str | None = None,
+        state: str | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        request: str | None = None,
+    ) -> tuple[list[UserData], bool]:
+        """
+        Return one page of users, newest first.
+
+        Args:
+            limit (int): Maximum number of users to return.
+            after (str | None): Only users older than this cursor.
+            before (str | None): Only users newer than this cursor.
+            state (str | None): Only users in this state.
+            since (float | None): Only users created at or after this time.
+            until (float | None): Only users created before this time.
+            request (str | None): Only users whose request contains this text.
+
+        Returns:
+            tuple[list[UserData], bool]: The page and whether more users
+                match beyond it in the walk direction.
+
+        Raises:
+            ValueError: If a cursor is malformed.
+        """
+        needle = request.casefold() if request else ""
+        page: list[UserData] = []
+        has_more = False
+
+        for user_id in self.__index.walk(after, before):
+            user_data = self.__tables[user_id]
+            if state is not None and user_data.get_state() != state:
+                continue
+            if since is not None and user_data.get_created_at() < since:
+                continue
+            if until is not None and user_data.get_created_at() >= until:
+                continue
+            if needle and needle not in user_data.get_request().casefold():
+                continue
+
+            if len(page) == limit:
+                has_more = True
+                break
+            page.append(user_data)
+
+        if before is not None:
+            page.reverse()
+
+        return page, has_more
+
+    def __cache_param(self, user_id: str, param: dict) -> None:
+        self.__params[user_id] = param
+        self.__params.move_to_end(user_id)
+        while len(self.__params) > self.__param_cache_size:
+            self.__params.popitem(last=False)
+
+    @staticmethod
+    def __read_params(paths: dict[str, str]) -> dict[str, dict]:
+        params = {}
+        for user_id, path in paths.items():
+            try:
+                with open(path, "r") as f:
+                    params[user_id] = json.load(f)
+            except (OSError, ValueError):
+                continue
+        return params
+
+    async def get_summaries(
+        self, user_ids: list[str], with_params: bool = True
+    ) -> dict[str, dict | None]:
+        """
+        Status, sizes, timestamps and LLM params of many users at once.
+
+        Everything except params comes from memory. Params are served from
+        a cache filled by load_param; the remaining ones are read in a
+        single pass off the event loop and cached.
+
+        Args:
+            user_ids (list[str]): UUIDs to look up.
+            with_params (bool): Whether to include the LLM params.
+
+        Returns:
+            dict[str, dict | None]: Summary per UUID, None for unknown users.
+        """
+        summaries: dict[str, dict | None] = {}
+        for user_id in user_ids:
+            if (user_data := self.__tables.get(user_id)) is None:
+                summaries[user_id] = None
+                continue
+
+            summaries[user_id] = {
+                "status": user_data.get_state() == UserData.READY,
+                "state": user_data.get_state(),
+                "assets": user_data.get_progress(),
+                "sizes": {
+                    UserData.ASSET_NAMES[file_type]: size
+                    for file_type, size in user_data.get_sizes().items()
+                },
+                "request": user_data.get_request(),
+                "created_at": user_data.get_created_at(),
+                "updated_at": user_data.get_updated_at(),
+            }
+
+        if not with_params:
+            return summaries
+
+        missing = {}
+        loaded: dict[str, dict] = {}
+        for user_id, summary in summaries.items():
+            if summary is None:
+                continue
+            if user_id in self.__params:
+                self.__params.move_to_end(user_id)
+            elif summary["assets"]["param"]:
+                missing[user_id] = self.__tables[user_id].get_asset_path(
+                    UserData.PARAM_FILE
+                )
+
+        if missing:
+            loaded = await asyncio.to_thread(self.__read_params, missing)
+            for user_id, param in loaded.items():
+                self.__cache_param(user_id, param)
+
+        for user_id, summary in summaries.items():
+            if summary is not None:
+                # looked up again: the cache may have evicted it meanwhile
+                summary["param"] = self.__params.get(user_id, loaded.get(user_id))
+        return summaries
 
     def list_users(self) -> list[UserData]:
         return list(self.__tables.values())
 
-    def load_qr(self, user_id: str, qr_data: BytesIO) -> None:
-        if user_id not in self.__tables.keys():
-            raise ValueError(f"User {user_id} not found in database.")
+    def get_disk_usage(self) -> dict[str, int]:
+        """
+        Bytes held by user assets, from the in-memory sizes, and bytes
+        still free on the filesystem holding the database.
+        """
+        used = sum(
+            sum(user_data.get_sizes().values()) for user_data in self.__tables.values()
+        )
+        stat = os.statvfs(self.__db_path)
+        return {"used": used, "free": stat.f_bavail * stat.f_frsize}
+
+    async def __compress(self, user_id: str, file_type: str, checksum: str) -> None:
+        async with self.__background_slots:
+            if (user_data := self.__tables.get(user_id)) is None:
+                return
+            try:
+                await asyncio.to_thread(
+                    self.__compressor.compress, user_data, file_type, checksum
+                )
+            except OSError as e:
+                self.__logger.log(
+                    f"Failed to compress {file_type} for {user_id}: {e}",
+                    LogLevel.WARNING,
+                )
+                return
 
-        self.__tables[user_id].load_qr(qr_data)
+            if user_id not in self.__tables:
+                return
+            if user_data.get_checksum(file_type) != checksum:
+                # replaced while we were compressing
+                await asyncio.to_thread(user_data.remove_variants, file_type)
+                return
+            # keep the recorded directory mtime current so the next startup
+            # does not rescan this user
+            self.__sync(user_id)
 
-    def load_image(self, user_id: str, image_data: UploadFile) -> None:
-        if user_id not in self.__tables.keys():
-            raise ValueError(f"User {user_id} not found in database.")
+    def __schedule_compression(self, user_id: str, file_type: str, checksum: str) -> None:
+        if not self.__compressor.is_compressible(file_type):
+            return
 
-        self.__tables[user_id].load_image(image_data)
+        self.__run_in_background(self.__compress(user_id, file_type, checksum))
 
-    def load_model(self, user_id: str, model_data: UploadFile) -> None:
-        if user_id not in self.__tables.keys():
-            raise ValueError(f"User {user_id} not found in database.")
+    def __run_in_background(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self.__background.add(task)
+        task.add_done_callback(self.__background.discard)
 
-        self.__tables[user_id].load_model(model_data)
+    async def __build_bundle(self, user_id: str) -> None:
+        async with self.__background_slots:
+            user_data = self.__tables.get(user_id)
+            if user_data is None or not user_data.is_ready():
+                return
 
-    def load_audio(self, user_id: str, audio_data: UploadFile) -> None:
-        if user_id not in self.__tables.keys():
-            raise ValueError(f"User {user_id} not found in database.")
+            checksums = user_data.get_checksums()
+            try:
+                await asyncio.to_thread(build_bundle, user_data)
+            except OSError as e:
+                self.__logger.log(
+                    f"Failed to build bundle for {user_id}: {e}", LogLevel.WARNING
+                )
+                return
 
-        self.__tables[user_id].load_audio(audio_data)
+            if user_data.get_checksums() != checksums:
+                # an asset was replaced while we were building
+                await asyncio.to_thread(user_data.remove_bundle)
+                return
+            self.__sync(user_id)
 
-    def load_param(self, user_id: str, param_data: dict) -> None:
-        if user_id not in self.__tables.keys():
-            raise ValueError(f"User {user_id} not found in database.")
+    def is_compressible(self, file_type: str) -> bool:
+        return self.__compressor.is_compressible(file_type)
+
+    def negotiate_encodings(self, file_type: str, accept_encoding: str) -> list[str]:
+        """
+        Precompressed encodings to try for an asset, most preferred first.
+        """
+        if not accept_encoding or not self.is_compressible(file_type):
+            return []
+
+        return self.__compressor.negotiate(accept_encoding)
+
+    async def close(self) -> None:
+        """
+        Wait for background compression and bundle builds to finish.
+        """
+        if self.__background:
+            await asyncio.gather(*self.__background, return_exceptions=True)
+
+    async def __load_asset(self, user_id: str, file_type: str, source: BinaryIO) -> None:
+        user_data = self.__get(user_id)
+        # the copy/fsync/rename runs off the event loop; the status flips only
+        # once the file has been committed
+        start = time.perf_counter()
+        size, checksum = await asyncio.to_thread(user_data.write_asset, file_type, source)
+        ASSET_WRITE_SECONDS.labels(UserData.ASSET_NAMES[file_type]).observe(
+            time.perf_counter() - start
+        )
+        self.__commit(user_data, file_type, size, checksum)
+
+    def __commit(self, user_data: UserData, file_type: str, size: int, checksum: str) -> None:
+        user_id = user_data.get_uuid()
+        state = user_data.get_state()
+        user_data.commit_asset(file_type, size, checksum)
+        self.__sync(user_id, state)
+        self.__schedule_compression(user_id, file_type, checksum)
+
+        progress = self.get_progress(user_id)
+        self.__notify(
+            user_id, "asset", {"asset": UserData.ASSET_NAMES[file_type], **progress}
+        )
+        if user_data.get_state() == UserData.READY and self.__prebuild_bundle:
+            self.__run_in_background(self.__build_bundle(user_id))
+        if state != UserData.READY and user_data.get_state() == UserData.READY:
+            self.__notify(user_id, "ready", progress)
+
+    async def install_asset(
+        self,
+        user_id: str,
+        file_type: str,
+        tmp_path: str,
+        size: int,
+        checksum: str,
+    ) -> None:
+        """
+        Commit an asset that was assembled in a temporary file in the user
+        directory, e.g. by a chunked upload.
+
+        Args:
+            user_id (str): The user's UUID.
+            file_type (str): One of UserData.FILES.
+            tmp_path (str): The fsynced temporary file.
+            size (int): Its size in bytes.
+            checksum (str): Its BLAKE2b checksum as produced by write_asset.
+        """
+        user_data = self.__get(user_id)
+        await asyncio.to_thread(user_data.install_asset, file_type, tmp_path)
+        self.__commit(user_data, file_type, size, checksum)
+
+    async def load_qr(self, user_id: str, qr_data: BytesIO) -> None:
+        qr_data.seek(0)
+        await self.__load_asset(user_id, UserData.QR_FILE, qr_data)
+
+    async def load_image(self, user_id: str, image_data: UploadFile) -> None:
+        await self.__load_asset(user_id, UserData.IMAGE_FILE, image_data.file)
+
+    async def load_model(self, user_id: str, model_data: UploadFile) -> None:
+        await self.__load_asset(user_id, UserData.MODEL_FILE, model_data.file)
+
+    async def load_audio(self, user_id: str, audio_data: UploadFile) -> None:
+        await self.__load_asset(user_id, UserData.AUDIO_FILE, audio_data.file)
 
-        self.__tables[user_id].load_param(param_data)
+    async def load_param(self, user_id: str, param_data: dict) -> None:
+        data = BytesIO(json.dumps(param_data, indent=4).encode("utf-8"))
+        await self.__load_asset(user_id, UserData.PARAM_FILE, data)
+        self.__cache_param(user_id, json.loads(data.getvalue()))
@@ -0,0 +1,106 @@
+import bisect
+import math
+
+from typing import Iterator
+
+
+class UserIndex:
+    """
+    Index of users ordered by creation time, with per-state counters.
+
+    Users are kept sorted by `(created_at, uuid)`, which also serves as
+    their pagination cursor. Both parts are persisted with the user, so a
+    cursor handed out before a restart still points at the same place, and
+    a page can be located with a binary search instead of walking the whole
+    table.
+    """
+
+    def __init__(self, states: tuple[str, ...]) -> None:
+        self.__keys: list[tuple[float, str]] = []
+        self.__created: dict[str, float] = {}
+        self.__counts = {state: 0 for state in states}
+
+    @staticmethod
+    def encode_cursor(created_at: float, user_id: str) -> str:
+        # repr round-trips the float exactly
+        return f"{created_at!r}_{user_id}"
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple[float, str]:
+        """
+        Raises:
+            ValueError: If the cursor was not produced by `encode_cursor`.
+        """
+        created_at, separator, user_id = cursor.partition("_")
+        if not separator or not user_id:
+            raise ValueError(f"Malformed cursor: {cursor}")
+
+        timestamp = float(created_at)
+        if not math.isfinite(timestamp):
+            raise ValueError(f"Malformed cursor: {cursor}")
+        return timestamp, user_id
+
+    def add(self, user_id: str, state: str, created_at: float) -> None:
+        if user_id in self.__created:
+            return
+
+        self.__created[user_id] = created_at
+        bisect.insort(self.__keys, (created_at, user_id))
+        self.__counts[state] += 1
+
+    def remove(self, user_id: str, state: str) -> None:
+        created_at = self.__created.pop(user_id, None)
+        if created_at is None:
+            return
+
+        position = bisect.bisect_left(self.__keys, (created_at, user_id))
+        del self.__keys[position]
+        self.__counts[state] -= 1
+
+    def move(self, old_state: str, new_state: str) -> None:
+        if old_state == new_state:
+            return
+
+        self.__counts[old_state] -= 1
+        self.__counts[new_state] += 1
+
+    def get_cursor(self, user_id: str) -> str | None:
+        if (created_at := self.__created.get(user_id)) is None:
+            return None
+        return UserIndex.encode_cursor(created_at, user_id)
+
+    def count(self, state: str | None = None) -> int:
+        if state is None:
+            return len(self.__keys)
+        return self.__counts.get(state, 0)
+
+    def walk(self, after: str | None = None, before: str | None = None) -> Iterator[str]:
+        """
+        Walk user IDs away from a cursor.
+
+        Without `before`, users are yielded newest first, starting just
+        older than `after` (or from the newest user). With `before`, users
+        newer than that cursor are yielded oldest first, i.e. nearest to the
+        cursor first. The cursor's user does not need to exist any more.
+
+        Args:
+            after (str | None): Cursor to continue after, towards older users.
+            before (str | None): Cursor to continue before, towards newer users.
+
+        Yields:
+            str: User IDs.
+
+        Raises:
+            ValueError: If a cursor is malformed.
+        """
+        if before is not None:
+            start = bisect.bisect_right(self.__keys, UserIndex.decode_cursor(before))
+            for position in range(start, len(self.__keys)):
+                yield self.__keys[position][1]
+            return
+
+        end = len(self.__keys)
+        if after is not None:
+            end = bisect.bisect_left(self.__keys, UserIndex.decode_cursor(after))
+        for position in range(end - 1, -1, -1):
+            yield self.__keys[position][1]
@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+
+from pylognet.client import LoggingClient, LogLevel
+
+from db.record import UserRecord
+from db.store import MetaStore
+
+
+class Manifest(MetaStore):
+    """
+    Append-only index of the users stored in the database directory.
+
+    Every write appends one JSON line; on load the last line for each UUID
+    wins. The log is compacted once it holds far more lines than users, so
+    startup stays a single sequential file read.
+    """
+
+    FILE = "manifest.jsonl"
+
+    def __init__(self, db_path: str, logger: LoggingClient) -> None:
+        self.__logger = logger
+        self.__path = os.path.join(db_path, Manifest.FILE)
+        self.__lock = threading.Lock()
+        self.__entries: dict[str, UserRecord] = {}
+        self.__lines = 0
+        self.__file = None
+
+    def load(self) -> dict[str, UserRecord]:
+        """
+        Read the manifest from disk.
+
+        Returns:
+            dict[str, UserRecord]: Entries keyed by UUID, in insertion order.
+        """
+        self.__entries = {}
+        self.__lines = 0
+        if os.path.exists(self.__path):
+            with open(self.__path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self.__lines += 1
+                    try:
+                        data = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a torn last line after a crash; reconcile fixes it up
+                        continue
+
+                    if data.get("removed", False):
+                        self.__entries.pop(data["uuid"], None)
+                        continue
+
+                    self.__entries[data["uuid"]] = UserRecord.from_dict(data)
+
+        return dict(self.__entries)
+
+    def __append(self, data: dict) -> None:
+        if self.__file is None:
+            self.__file = open(self.__path, "a", encoding="utf-8")
+
+        self.__file.write(json.dumps(data, ensure_ascii=False) + "\n")
+        self.__file.flush()
+        self.__lines += 1
+
+        if self.__lines > 2 * len(self.__entries) + 1000:
+            self.__compact()
+
+    def __compact(self) -> None:
+        tmp_path = self.__path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self.__entries.values():
+                f.write(json.dumps(entry.to_dict(), ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+        os.replace(tmp_path, self.__path)
+        self.__lines = len(self.__entries)
+
+        self.__logger.log(
+            f"Manifest compacted to {self.__lines} entries",
+            LogLevel.DEBUG,
+        )
+
+    def update(self, record: UserRecord) -> None:
+        with self.__lock:
+            self.__entries[record.uuid] = record
+            self.__append(record.to_dict())
+
+    def remove(self, user_id: str) -> None:
+        with self.__lock:
+            if self.__entries.pop(user_id, None) is None:
+                return
+            self.__append({"uuid": user_id, "removed": True})
+
+    def close(self) -> None:
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
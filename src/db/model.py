@@ -1,193 +1,362 @@
-import shutil
+import base64
+import hashlib
 import os
 import json
+import tempfile
+import time
+import uuid
 
-from fastapi import UploadFile
-from io import BytesIO
 from pydantic import BaseModel
+from typing import BinaryIO
 
 
 class MetaData(BaseModel):
     uuid: str
     email: str
-    qr_code: str
+    # kept for meta.json files written by older versions; the QR code is
+    # read from qr.png when needed
+    qr_code: str = ""
     request: str
 
 
 class UserData:
+    """
+    In-memory record of a stored user.
+
+    Kept deliberately small since one exists per user: status is a bitmask,
+    file paths are derived on demand and the QR code is read from disk only
+    when it is needed.
+    """
+
+    __slots__ = (
+        "__db_path",
+        "__uuid",
+        "__status",
+        "__sizes",
+        "__checksums",
+        "__created_at",
+        "__updated_at",
+        "__email",
+        "__request",
+    )
+
     META_FILE = "meta.json"
     QR_FILE = "qr.png"
     IMAGE_FILE = "image.png"
     MODEL_FILE = "model.glb"
     AUDIO_FILE = "audio.wav"
     PARAM_FILE = "params.json"
+    BUNDLE_FILE = "bundle.zip"
+
+    FILES = (QR_FILE, IMAGE_FILE, MODEL_FILE, AUDIO_FILE, PARAM_FILE)
+    # short names used in API responses and events
+    ASSET_NAMES = {
+        QR_FILE: "qr",
+        IMAGE_FILE: "image",
+        MODEL_FILE: "model",
+        AUDIO_FILE: "audio",
+        PARAM_FILE: "param",
+    }
+    STATUS_BITS = {file_type: 1 << i for i, file_type in enumerate(FILES)}
+    READY_BITS = (1 << len(FILES)) - 1
+    FAILED_BIT = 1 << len(FILES)
+
+    BUFFER_SIZE = 1024 * 1024
+
+    # suffixes of the precompressed variants written by AssetCompressor
+    VARIANTS = {"gzip": ".gz", "zstd": ".zst", "br": ".br"}
+
+    READY = "ready"
+    PENDING = "pending"
+    FAILED = "failed"
+    STATES = (READY, PENDING, FAILED)
+
+    def __init__(self, user_id: str, db_path: str, create: bool = True):
+        # raises ValueError for entries that are not user directories
+        uuid.UUID(user_id)
 
-    def __init__(self, user_id: str, db_path: str):
         self.__db_path = db_path
         self.__uuid = user_id
-        self.__meta_path = os.path.join(self.get_user_path(), UserData.META_FILE)
-        self.__qr_path = os.path.join(self.get_user_path(), UserData.QR_FILE)
-        self.__image_path = os.path.join(self.get_user_path(), UserData.IMAGE_FILE)
-        self.__model_path = os.path.join(self.get_user_path(), UserData.MODEL_FILE)
-        self.__audio_path = os.path.join(self.get_user_path(), UserData.AUDIO_FILE)
-        self.__param_path = os.path.join(self.get_user_path(), UserData.PARAM_FILE)
-        self.__status = {
-            UserData.QR_FILE: False,
-            UserData.IMAGE_FILE: False,
-            UserData.MODEL_FILE: False,
-            UserData.AUDIO_FILE: False,
-            UserData.PARAM_FILE: False,
+        self.__status = 0
+        self.__sizes = [0] * len(UserData.FILES)
+        self.__checksums = [""] * len(UserData.FILES)
+        self.__created_at = time.time() if create else 0.0
+        self.__updated_at = self.__created_at
+        self.__email = ""
+        self.__request = ""
+
+        if create:
+            os.makedirs(self.get_user_path(), exist_ok=True)
+
+    def set_meta(self, email: str, request: str) -> None:
+        self.__email = email
+        self.__request = request
+
+    def get_email(self) -> str:
+        return self.__email
+
+    def get_request(self) -> str:
+        return self.__request
+
+    def get_qr_code(self) -> str:
+        """
+        Read the QR code image from disk.
+
+        Returns:
+            str: The base64-encoded PNG, or an empty string if there is none.
+        """
+        qr_path = self.get_qr_path()
+        if not qr_path:
+            return ""
+
+        with open(qr_path, "rb") as f:
+            return base64.b64encode(f.read()).decode("utf-8")
+
+    def get_sizes(self) -> dict[str, int]:
+        return {
+            file_type: self.__sizes[i]
+            for i, file_type in enumerate(UserData.FILES)
+            if self.__status & (1 << i)
         }
 
-        self.meta = MetaData(
-            uuid=self.__uuid,
-            email="",
-            qr_code="",
-            request="",
-        )
+    def set_sizes(self, sizes: dict[str, int]) -> None:
+        for i, file_type in enumerate(UserData.FILES):
+            self.__sizes[i] = sizes.get(file_type, 0)
+
+    def get_checksum(self, file_type: str) -> str:
+        return self.__checksums[UserData.FILES.index(file_type)]
+
+    def get_checksums(self) -> dict[str, str]:
+        return {
+            file_type: self.__checksums[i]
+            for i, file_type in enumerate(UserData.FILES)
+            if self.__status & (1 << i) and self.__checksums[i]
+        }
 
-        os.makedirs(self.get_user_path(), exist_ok=True)
+    def set_checksums(self, checksums: dict[str, str]) -> None:
+        for i, file_type in enumerate(UserData.FILES):
+            self.__checksums[i] = checksums.get(file_type, "")
+
+    def get_created_at(self) -> float:
+        return self.__created_at
+
+    def get_updated_at(self) -> float:
+        return self.__updated_at
+
+    def set_timestamps(self, created_at: float, updated_at: float) -> None:
+        self.__created_at = created_at
+        self.__updated_at = updated_at
 
     def get_uuid(self) -> str:
         return self.__uuid
 
     def get_user_path(self) -> str:
-        return os.path.join(self.__db_path, str(self.__uuid))
+        return os.path.join(self.__db_path, self.__uuid)
+
+    def __get_path(self, file_name: str) -> str:
+        return os.path.join(self.__db_path, self.__uuid, file_name)
+
+    def __get_existing_path(self, file_name: str) -> str:
+        path = self.__get_path(file_name)
+        return path if os.path.exists(path) else ""
+
+    def get_asset_path(self, file_type: str) -> str:
+        """
+        Path of an asset whether or not it exists, for callers that stat it
+        themselves.
+        """
+        return self.__get_path(file_type)
+
+    def get_variant_path(self, file_type: str, encoding: str) -> str:
+        return self.__get_path(file_type + UserData.VARIANTS[encoding])
+
+    def get_bundle_path(self) -> str:
+        return self.__get_path(UserData.BUNDLE_FILE)
+
+    def remove_bundle(self) -> None:
+        try:
+            os.remove(self.get_bundle_path())
+        except FileNotFoundError:
+            pass
+
+    def remove_variants(self, file_type: str) -> None:
+        for suffix in UserData.VARIANTS.values():
+            try:
+                os.remove(self.__get_path(file_type + suffix))
+            except FileNotFoundError:
+                pass
 
     def get_meta_path(self) -> str:
-        return self.__meta_path if os.path.exists(self.__meta_path) else ""
+        return self.__get_existing_path(UserData.META_FILE)
 
     def get_qr_path(self) -> str:
-        return self.__qr_path if os.path.exists(self.__qr_path) else ""
+        return self.__get_existing_path(UserData.QR_FILE)
 
     def get_image_path(self) -> str:
-        return self.__image_path if os.path.exists(self.__image_path) else ""
+        return self.__get_existing_path(UserData.IMAGE_FILE)
 
     def get_model_path(self) -> str:
-        return self.__model_path if os.path.exists(self.__model_path) else ""
+        return self.__get_existing_path(UserData.MODEL_FILE)
 
     def get_audio_path(self) -> str:
-        return self.__audio_path if os.path.exists(self.__audio_path) else ""
+        return self.__get_existing_path(UserData.AUDIO_FILE)
 
     def get_param_path(self) -> str:
-        return self.__param_path if os.path.exists(self.__param_path) else ""
+        return self.__get_existing_path(UserData.PARAM_FILE)
 
     def set_status(self, file_type: str, status: bool) -> None:
-        if file_type in self.__status.keys():
-            self.__status[file_type] = status
+        if file_type not in UserData.STATUS_BITS.keys():
+            return
+
+        if status:
+            self.__status |= UserData.STATUS_BITS[file_type]
+        else:
+            self.__status &= ~UserData.STATUS_BITS[file_type]
 
     def is_ready(self) -> bool:
-        return all(self.__status.values())
+        return self.__status & UserData.READY_BITS == UserData.READY_BITS
+
+    def set_failed(self, failed: bool) -> None:
+        if failed:
+            self.__status |= UserData.FAILED_BIT
+        else:
+            self.__status &= ~UserData.FAILED_BIT
+
+    def get_state(self) -> str:
+        # a failure is final: assets posted late must not turn it into ready
+        if self.__status & UserData.FAILED_BIT:
+            return UserData.FAILED
+        if self.is_ready():
+            return UserData.READY
+        return UserData.PENDING
+
+    def get_progress(self) -> dict[str, bool]:
+        return {
+            UserData.ASSET_NAMES[file_type]: bool(self.__status & bit)
+            for file_type, bit in UserData.STATUS_BITS.items()
+        }
+
+    def get_status_bits(self) -> int:
+        return self.__status
+
+    def set_status_bits(self, bits: int) -> None:
+        self.__status = bits & (UserData.READY_BITS | UserData.FAILED_BIT)
+
+    def scan_files(self) -> None:
+        """
+        Rebuild the status flags from the files present in the user directory.
+        """
+        sizes = {}
+        with os.scandir(self.get_user_path()) as entries:
+            for entry in entries:
+                if entry.name in UserData.STATUS_BITS.keys():
+                    sizes[entry.name] = entry.stat().st_size
+
+        self.__status &= UserData.FAILED_BIT
+        for file_type in sizes.keys():
+            self.set_status(file_type, True)
+        self.set_sizes(sizes)
 
     def remove_all_files(self) -> None:
         if not os.path.exists(self.get_user_path()):
             return
 
-        if os.path.exists(self.__meta_path):
-            os.remove(self.__meta_path)
-        if os.path.exists(self.__qr_path):
-            os.remove(self.__qr_path)
-        if os.path.exists(self.__image_path):
-            os.remove(self.__image_path)
-        if os.path.exists(self.__model_path):
-            os.remove(self.__model_path)
-        if os.path.exists(self.__audio_path):
-            os.remove(self.__audio_path)
-        if os.path.exists(self.__param_path):
-            os.remove(self.__param_path)
-
-        self.__status = {
-            UserData.QR_FILE: False,
-            UserData.IMAGE_FILE: False,
-            UserData.MODEL_FILE: False,
-            UserData.AUDIO_FILE: False,
-            UserData.PARAM_FILE: False,
-        }
+        for file_name in (UserData.META_FILE,) + UserData.FILES:
+            if path := self.__get_existing_path(file_name):
+                os.remove(path)
+            self.remove_variants(file_name)
+        self.remove_bundle()
+
+        self.__status = 0
+        self.__sizes = [0] * len(UserData.FILES)
+        self.__checksums = [""] * len(UserData.FILES)
 
     def save_meta(self) -> None:
         """
         Save metadata to a JSON file.
         """
-        with open(self.__meta_path, "w") as f:
-            json.dump(self.meta.model_dump(), f, indent=4)
+        meta = MetaData(uuid=self.__uuid, email=self.__email, request=self.__request)
+        with open(self.__get_path(UserData.META_FILE), "w") as f:
+            json.dump(meta.model_dump(exclude={"qr_code"}), f, indent=4)
 
     def load_meta(self) -> None:
         """
         Load metadata from a JSON file.
         """
-        if not os.path.exists(self.__meta_path):
+        if not (meta_path := self.get_meta_path()):
             return
 
-        with open(self.__meta_path, "r") as f:
-            data = json.load(f)
-            self.meta = MetaData(**data)
+        with open(meta_path, "r") as f:
+            meta = MetaData(**json.load(f))
+            self.set_meta(meta.email, meta.request)
 
-    def load_qr(self, qr_data: BytesIO) -> None:
-        """
-        Write QR code data to a file.
-
-        Args:
-            qr_data (BytesIO): QR code image data in bytes.
+    def write_asset(self, file_type: str, source: BinaryIO) -> tuple[int, str]:
         """
-        self.__status[UserData.QR_FILE] = True
-        if os.path.exists(self.__qr_path):
-            os.remove(self.__qr_path)
+        Stream an asset into place without touching the in-memory status.
 
-        with open(self.__qr_path, "wb") as f:
-            f.write(qr_data.getbuffer())
-
-    def load_image(self, image_data: UploadFile) -> None:
-        """
-        Write image data to a file.
+        The data is copied to a temporary file in the user directory while
+        its size and checksum are computed, fsynced and then atomically
+        renamed over the target, so readers never see a partial file. This
+        blocks on disk I/O and is meant to run off the event loop.
 
         Args:
-            image_data (UploadFile): Image file uploaded by the user.
-        """
-        self.__status[UserData.IMAGE_FILE] = True
-        if os.path.exists(self.__image_path):
-            os.remove(self.__image_path)
-
-        with open(self.__image_path, "wb") as f:
-            shutil.copyfileobj(image_data.file, f)
+            file_type (str): One of UserData.FILES.
+            source (BinaryIO): Readable binary stream with the asset data.
 
-    def load_model(self, model_data: UploadFile) -> None:
-        """
-        Write model data to a file.
-
-        Args:
-            model_data (UploadFile): Model file uploaded by the user.
+        Returns:
+            tuple[int, str]: The size in bytes and the hex checksum.
         """
-        self.__status[UserData.MODEL_FILE] = True
-        if os.path.exists(self.__model_path):
-            os.remove(self.__model_path)
+        if file_type not in UserData.STATUS_BITS.keys():
+            raise ValueError(f"Unknown asset type: {file_type}")
 
-        with open(self.__model_path, "wb") as f:
-            shutil.copyfileobj(model_data.file, f)
-
-    def load_audio(self, audio_data: UploadFile) -> None:
+        checksum = hashlib.blake2b(digest_size=16)
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.get_user_path(), prefix=f".{file_type}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while chunk := source.read(UserData.BUFFER_SIZE):
+                    checksum.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            self.install_asset(file_type, tmp_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return size, checksum.hexdigest()
+
+    def install_asset(self, file_type: str, tmp_path: str) -> None:
         """
-        Write audio data to a file.
+        Atomically move a completely written and fsynced file into place.
 
         Args:
-            audio_data (UploadFile): Audio file uploaded by the user.
+            file_type (str): One of UserData.FILES.
+            tmp_path (str): Temporary file in the user directory.
         """
-        self.__status[UserData.AUDIO_FILE] = True
-        if os.path.exists(self.__audio_path):
-            os.remove(self.__audio_path)
+        if file_type not in UserData.STATUS_BITS.keys():
+            raise ValueError(f"Unknown asset type: {file_type}")
 
-        with open(self.__audio_path, "wb") as f:
-            shutil.copyfileobj(audio_data.file, f)
+        # variants and the bundle of the previous file must not outlive it
+        self.remove_variants(file_type)
+        self.remove_bundle()
+        os.replace(tmp_path, self.__get_path(file_type))
 
-    def load_param(self, param_data: dict) -> None:
-        """
-        Write parameter data to a JSON file.
+        dir_fd = os.open(self.get_user_path(), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
 
-        Args:
-            param_data (dict): Parameter data in dictionary format.
+    def commit_asset(self, file_type: str, size: int, checksum: str) -> None:
         """
-        self.__status[UserData.PARAM_FILE] = True
-        if os.path.exists(self.__param_path):
-            os.remove(self.__param_path)
-
-        with open(self.__param_path, "w") as f:
-            json.dump(param_data, f, indent=4)
+        Mark an asset written by `write_asset` as available.
+        """
+        index = UserData.FILES.index(file_type)
+        self.__sizes[index] = size
+        self.__checksums[index] = checksum
+        self.set_status(file_type, True)
@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import uuid
+from io import BytesIO
+
+from pylognet.client import LoggingClient, LogLevel
+
+from db.controller import DataBase
+from db.model import UserData
+from qr.handler import QRHandler
+
+
+class Slot:
+    """
+    A pre-allocated user: directory created and QR code already written.
+    """
+
+    __slots__ = ("uuid", "path", "qr_size", "qr_checksum")
+
+    def __init__(self, user_id: str, path: str, qr_size: int, qr_checksum: str) -> None:
+        self.uuid = user_id
+        self.path = path
+        self.qr_size = qr_size
+        self.qr_checksum = qr_checksum
+
+
+class SlotPool:
+    """
+    Keeps a stock of ready-made user slots under `<db>/.pool` so that new
+    requests only have to rename a directory and write their metadata.
+
+    The pool is refilled in the background whenever it drops below the
+    low-water mark. Slots left over from a previous run are reused.
+    """
+
+    POOL_DIR = ".pool"
+
+    def __init__(
+        self,
+        config: dict,
+        db: DataBase,
+        qr_handler: QRHandler,
+        logger: LoggingClient,
+        debug_mode: bool = False,
+    ) -> None:
+        self.__debug = debug_mode
+        self.__db = db
+        self.__qr_handler = qr_handler
+        self.__logger = logger
+        self.__config = config.get("pool", {})
+        self.__enabled = bool(self.__config.get("enabled", True))
+        self.__size = int(self.__config.get("size", 32))
+        self.__low_water = min(int(self.__config.get("low_water", 8)), self.__size)
+        self.__path = os.path.join(db.get_path(), SlotPool.POOL_DIR)
+        self.__slots: list[Slot] = []
+        self.__refill = asyncio.Event()
+        self.__task: asyncio.Task | None = None
+        self.__claimed = 0
+        self.__misses = 0
+
+    def __load(self) -> list[Slot]:
+        os.makedirs(self.__path, exist_ok=True)
+        slots = []
+        with os.scandir(self.__path) as entries:
+            for entry in entries:
+                qr_path = os.path.join(entry.path, UserData.QR_FILE)
+                try:
+                    uuid.UUID(entry.name)
+                    with open(qr_path, "rb") as f:
+                        data = f.read()
+                except (ValueError, OSError):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    continue
+                checksum = hashlib.blake2b(data, digest_size=16).hexdigest()
+                slots.append(Slot(entry.name, entry.path, len(data), checksum))
+        return slots
+
+    def __make_slot(self) -> Slot:
+        user_id = str(uuid.uuid4())
+        user_data = UserData(user_id, self.__path)
+        size, checksum = user_data.write_asset(
+            UserData.QR_FILE, BytesIO(self.__qr_handler.render_png(user_id))
+        )
+        return Slot(user_id, user_data.get_user_path(), size, checksum)
+
+    async def __run(self) -> None:
+        while True:
+            await self.__refill.wait()
+            self.__refill.clear()
+            while len(self.__slots) < self.__size:
+                try:
+                    self.__slots.append(await asyncio.to_thread(self.__make_slot))
+                except OSError as e:
+                    self.__logger.log(f"Failed to pre-allocate slot: {e}", LogLevel.ERROR)
+                    break
+
+    async def start(self) -> None:
+        if not self.__enabled or self.__task is not None:
+            return
+
+        self.__slots = await asyncio.to_thread(self.__load)
+        self.__logger.log(f"Reusing {len(self.__slots)} pooled slots", LogLevel.INFO)
+        self.__task = asyncio.create_task(self.__run())
+        self.__refill.set()
+
+    async def stop(self) -> None:
+        if self.__task is None:
+            return
+
+        self.__task.cancel()
+        await asyncio.gather(self.__task, return_exceptions=True)
+        self.__task = None
+
+    def claim(self, email: str, request: str) -> str | None:
+        """
+        Turn a pooled slot into a registered user.
+
+        Args:
+            email (str): The user's email address.
+            request (str): The user's request.
+
+        Returns:
+            str | None: The new user's UUID, or None if the pool is empty and
+                the caller has to create the user itself.
+        """
+        if not self.__slots:
+            self.__misses += 1
+            self.__refill.set()
+            return None
+
+        slot = self.__slots.pop()
+        if len(self.__slots) < self.__low_water:
+            self.__refill.set()
+
+        self.__db.adopt_user(
+            slot.uuid, slot.path, slot.qr_size, slot.qr_checksum, email, request
+        )
+        self.__claimed += 1
+        return slot.uuid
+
+    def get_stats(self) -> dict:
+        return {
+            "available": len(self.__slots),
+            "size": self.__size,
+            "low_water": self.__low_water,
+            "claimed": self.__claimed,
+            "misses": self.__misses,
+        }
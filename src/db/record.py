@@ -0,0 +1,65 @@
+class UserRecord:
+    """
+    Compact per-user index record kept by the metadata stores.
+    """
+
+    __slots__ = (
+        "uuid",
+        "status",
+        "request",
+        "email",
+        "mtime",
+        "created_at",
+        "updated_at",
+        "sizes",
+        "checksums",
+    )
+
+    def __init__(
+        self,
+        uuid: str,
+        status: int = 0,
+        request: str = "",
+        email: str = "",
+        mtime: int = 0,
+        created_at: float = 0.0,
+        updated_at: float = 0.0,
+        sizes: dict[str, int] | None = None,
+        checksums: dict[str, str] | None = None,
+    ) -> None:
+        self.uuid = uuid
+        self.status = status
+        self.request = request
+        self.email = email
+        self.mtime = mtime
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.sizes = sizes if sizes is not None else {}
+        self.checksums = checksums if checksums is not None else {}
+
+    def to_dict(self) -> dict:
+        return {
+            "uuid": self.uuid,
+            "status": self.status,
+            "request": self.request,
+            "email": self.email,
+            "mtime": self.mtime,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "sizes": self.sizes,
+            "checksums": self.checksums,
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "UserRecord":
+        return UserRecord(
+            data["uuid"],
+            data.get("status", 0),
+            data.get("request", ""),
+            data.get("email", ""),
+            data.get("mtime", 0),
+            data.get("created_at", 0.0),
+            data.get("updated_at", 0.0),
+            data.get("sizes", {}),
+            data.get("checksums", {}),
+        )
@@ -0,0 +1,150 @@
+import os
+import sqlite3
+import threading
+
+from pylognet.client import LoggingClient, LogLevel
+
+from db.model import UserData
+from db.record import UserRecord
+from db.store import MetaStore
+
+
+class SQLiteStore(MetaStore):
+    """
+    SQLite (WAL mode) backend for user metadata, asset status and sizes.
+
+    Asset files stay in the user directories; only their metadata lives in
+    the database. With WAL and synchronous=NORMAL, commits are appended to
+    the log and fsynced together at checkpoints.
+    """
+
+    FILE = "meta.db"
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            uuid TEXT NOT NULL UNIQUE,
+            email TEXT NOT NULL DEFAULT '',
+            request TEXT NOT NULL DEFAULT '',
+            status INTEGER NOT NULL DEFAULT 0,
+            mtime INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS assets (
+            uuid TEXT NOT NULL,
+            name TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            checksum TEXT NOT NULL DEFAULT '',
+            PRIMARY KEY (uuid, name)
+        ) WITHOUT ROWID
+        """,
+    )
+
+    UPSERT_USER = """
+        INSERT INTO users (uuid, email, request, status, mtime, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (uuid) DO UPDATE SET
+            email = excluded.email,
+            request = excluded.request,
+            status = excluded.status,
+            mtime = excluded.mtime,
+            updated_at = excluded.updated_at
+    """
+    UPSERT_ASSET = """
+        INSERT INTO assets (uuid, name, size, checksum) VALUES (?, ?, ?, ?)
+        ON CONFLICT (uuid, name) DO UPDATE SET
+            size = excluded.size,
+            checksum = excluded.checksum
+    """
+    UPDATE_META = "UPDATE users SET email = ?, request = ? WHERE uuid = ?"
+    SELECT_META = "SELECT email, request FROM users WHERE uuid = ?"
+
+    def __init__(self, db_path: str, logger: LoggingClient) -> None:
+        self.__logger = logger
+        self.__path = os.path.join(db_path, SQLiteStore.FILE)
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(self.__path, check_same_thread=False)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        with self.__conn:
+            for statement in SQLiteStore.SCHEMA:
+                self.__conn.execute(statement)
+
+    def load(self) -> dict[str, UserRecord]:
+        records: dict[str, UserRecord] = {}
+        with self.__lock:
+            rows = self.__conn.execute(
+                "SELECT uuid, status, request, email, mtime, created_at, updated_at "
+                "FROM users ORDER BY seq"
+            )
+            for row in rows:
+                records[row[0]] = UserRecord(*row)
+
+            for user_id, name, size, checksum in self.__conn.execute(
+                "SELECT uuid, name, size, checksum FROM assets"
+            ):
+                if user_id in records:
+                    records[user_id].sizes[name] = size
+                    if checksum:
+                        records[user_id].checksums[name] = checksum
+
+        self.__logger.log(
+            f"Loaded {len(records)} users from {self.__path}",
+            LogLevel.DEBUG,
+        )
+        return records
+
+    def update(self, record: UserRecord) -> None:
+        with self.__lock, self.__conn:
+            self.__conn.execute(
+                SQLiteStore.UPSERT_USER,
+                (
+                    record.uuid,
+                    record.email,
+                    record.request,
+                    record.status,
+                    record.mtime,
+                    record.created_at,
+                    record.updated_at,
+                ),
+            )
+            self.__conn.executemany(
+                SQLiteStore.UPSERT_ASSET,
+                [
+                    (record.uuid, name, size, record.checksums.get(name, ""))
+                    for name, size in record.sizes.items()
+                ],
+            )
+
+    def remove(self, user_id: str) -> None:
+        with self.__lock, self.__conn:
+            self.__conn.execute("DELETE FROM users WHERE uuid = ?", (user_id,))
+            self.__conn.execute("DELETE FROM assets WHERE uuid = ?", (user_id,))
+
+    def save_meta(self, user_data: UserData) -> None:
+        with self.__lock, self.__conn:
+            self.__conn.execute(
+                SQLiteStore.UPDATE_META,
+                (user_data.get_email(), user_data.get_request(), user_data.get_uuid()),
+            )
+
+    def load_meta(self, user_data: UserData) -> None:
+        with self.__lock:
+            row = self.__conn.execute(
+                SQLiteStore.SELECT_META, (user_data.get_uuid(),)
+            ).fetchone()
+
+        if row is None:
+            # users created before switching backends still have meta.json
+            user_data.load_meta()
+            return
+
+        user_data.set_meta(row[0], row[1])
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__conn.close()
@@ -0,0 +1,33 @@
+from abc import ABC, abstractmethod
+
+from db.model import UserData
+from db.record import UserRecord
+
+
+class MetaStore(ABC):
+    """
+    Interface of the user metadata backends used by DataBase.
+
+    The default metadata methods read and write the per-user meta.json;
+    backends that keep metadata themselves override them. Listing and
+    counting are served by DataBase's in-memory UserIndex, so stores only
+    persist records.
+    """
+
+    @abstractmethod
+    def load(self) -> dict[str, UserRecord]: ...
+
+    @abstractmethod
+    def update(self, record: UserRecord) -> None: ...
+
+    @abstractmethod
+    def remove(self, user_id: str) -> None: ...
+
+    def save_meta(self, user_data: UserData) -> None:
+        user_data.save_meta()
+
+    def load_meta(self, user_data: UserData) -> None:
+        user_data.load_meta()
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,324 @@
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+
+from pylognet.client import LoggingClient, LogLevel
+
+from db.controller import DataBase
+from db.model import UserData
+
+
+class UploadBusyError(Exception):
+    """
+    Raised when an upload session is being finalized and cannot be
+    written to, finalized again or aborted, or when it is finalized while
+    chunk writes are still in flight.
+    """
+
+
+class UploadSession:
+    """
+    State of one resumable upload: a preallocated part file in the user
+    directory and a map of the chunks received so far.
+    """
+
+    __slots__ = (
+        "upload_id",
+        "user_id",
+        "file_type",
+        "size",
+        "chunk_size",
+        "path",
+        "received",
+        "updated_at",
+        "finalizing",
+        "writes",
+    )
+
+    def __init__(
+        self,
+        user_id: str,
+        file_type: str,
+        size: int,
+        chunk_size: int,
+        user_path: str,
+    ) -> None:
+        self.upload_id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.file_type = file_type
+        self.size = size
+        self.chunk_size = chunk_size
+        self.path = os.path.join(user_path, f".{file_type}.{self.upload_id}.part")
+        self.received = bytearray(self.get_chunk_count())
+        self.updated_at = time.monotonic()
+        self.finalizing = False
+        self.writes = 0
+
+    def get_chunk_count(self) -> int:
+        return max(1, -(-self.size // self.chunk_size))
+
+    def get_chunk_length(self, index: int) -> int:
+        if self.size == 0:
+            return 0
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    def get_missing(self) -> list[int]:
+        return [i for i, received in enumerate(self.received) if not received]
+
+    def get_missing_ranges(self) -> list[list[int]]:
+        """
+        Missing data as [start, end) byte ranges, with adjacent chunks merged.
+        """
+        ranges: list[list[int]] = []
+        for index in self.get_missing():
+            start = index * self.chunk_size
+            end = start + self.get_chunk_length(index)
+            if ranges and ranges[-1][1] == start:
+                ranges[-1][1] = end
+            else:
+                ranges.append([start, end])
+        return ranges
+
+    def is_complete(self) -> bool:
+        return all(self.received)
+
+    def to_dict(self) -> dict:
+        return {
+            "upload_id": self.upload_id,
+            "user_id": self.user_id,
+            "file": self.file_type,
+            "size": self.size,
+            "chunk_size": self.chunk_size,
+            "chunks": self.get_chunk_count(),
+            "missing": self.get_missing(),
+            "missing_ranges": self.get_missing_ranges(),
+        }
+
+
+class UploadManager:
+    """
+    Chunked, resumable uploads committed through DataBase.
+
+    Chunks may arrive in any order or in parallel and are written straight
+    to their offset in a part file, so finalizing needs no reassembly: the
+    file is hashed, checked against the client's checksum and atomically
+    renamed into place.
+    """
+
+    ALGORITHMS = ("sha256", "md5", "blake2b")
+
+    def __init__(
+        self,
+        config: dict,
+        db: DataBase,
+        logger: LoggingClient,
+        debug_mode: bool = False,
+    ) -> None:
+        self.__debug = debug_mode
+        self.__db = db
+        self.__logger = logger
+        self.__config = config.get("upload", {})
+        self.__chunk_size = int(self.__config.get("chunk_size", 4 * 1024 * 1024))
+        self.__max_size = int(self.__config.get("max_size", 1024 * 1024 * 1024))
+        self.__ttl = float(self.__config.get("ttl", 3600))
+        self.__sessions: dict[str, UploadSession] = {}
+        self.__purger: asyncio.Task | None = None
+        self.__db.add_listener(self.__on_db_event)
+
+    def start(self) -> None:
+        if self.__purger is None:
+            self.__purger = asyncio.create_task(self.__run())
+
+    async def stop(self) -> None:
+        if self.__purger is not None:
+            self.__purger.cancel()
+            await asyncio.gather(self.__purger, return_exceptions=True)
+            self.__purger = None
+
+    async def __run(self) -> None:
+        # abandoned part files are removed even if no new upload starts
+        while True:
+            await asyncio.sleep(min(self.__ttl, 60.0))
+            try:
+                await self.__expire()
+            except Exception as e:
+                self.__logger.log(f"Failed to purge uploads: {e}", LogLevel.ERROR)
+
+    def __on_db_event(self, user_id: str, event: str, data: dict) -> None:
+        if event != "removed":
+            return
+        # the part files went with the user directory; a session being
+        # finalized fails on its own when it tries to install the asset
+        for session in list(self.__sessions.values()):
+            if session.user_id == user_id and not session.finalizing:
+                self.__sessions.pop(session.upload_id, None)
+
+    def get_chunk_size(self) -> int:
+        return self.__chunk_size
+
+    def get(self, upload_id: str) -> UploadSession | None:
+        return self.__sessions.get(upload_id)
+
+    async def __discard(self, session: UploadSession) -> None:
+        self.__sessions.pop(session.upload_id, None)
+        try:
+            await asyncio.to_thread(os.remove, session.path)
+        except FileNotFoundError:
+            pass
+
+    async def __expire(self) -> None:
+        deadline = time.monotonic() - self.__ttl
+        for session in list(self.__sessions.values()):
+            if session.finalizing or session.writes:
+                continue
+            if session.updated_at < deadline:
+                self.__logger.log(
+                    f"Upload {session.upload_id} for {session.user_id} expired",
+                    LogLevel.WARNING,
+                )
+                await self.__discard(session)
+
+    async def create(
+        self,
+        user_id: str,
+        file_type: str,
+        size: int,
+        chunk_size: int | None = None,
+    ) -> UploadSession:
+        """
+        Start an upload session.
+
+        Raises:
+            ValueError: If the user does not exist or the size is invalid.
+        """
+        await self.__expire()
+
+        user_data = self.__db.get_user(user_id)
+        if user_data is None:
+            raise ValueError(f"User {user_id} not found.")
+        if not 0 <= size <= self.__max_size:
+            raise ValueError(f"Size must be between 0 and {self.__max_size} bytes.")
+
+        session = UploadSession(
+            user_id,
+            file_type,
+            size,
+            max(1, chunk_size or self.__chunk_size),
+            user_data.get_user_path(),
+        )
+
+        def preallocate() -> None:
+            with open(session.path, "wb") as f:
+                f.truncate(size)
+
+        await asyncio.to_thread(preallocate)
+        self.__sessions[session.upload_id] = session
+        return session
+
+    async def write_chunk(self, upload_id: str, index: int, data: bytes) -> UploadSession:
+        """
+        Store one chunk. Re-sending a chunk simply overwrites it.
+
+        Raises:
+            KeyError: If the session does not exist.
+            UploadBusyError: If the session is being finalized.
+            ValueError: If the index or chunk length is invalid.
+        """
+        session = self.__sessions[upload_id]
+        if session.finalizing:
+            raise UploadBusyError(f"Upload {upload_id} is being finalized.")
+        if not 0 <= index < session.get_chunk_count():
+            raise ValueError(f"Chunk index {index} out of range.")
+        if len(data) != session.get_chunk_length(index):
+            raise ValueError(
+                f"Chunk {index} must be {session.get_chunk_length(index)} bytes, got {len(data)}."
+            )
+
+        def write() -> None:
+            fd = os.open(session.path, os.O_WRONLY)
+            try:
+                os.pwrite(fd, data, index * session.chunk_size)
+            finally:
+                os.close(fd)
+
+        session.writes += 1
+        try:
+            await asyncio.to_thread(write)
+        finally:
+            session.writes -= 1
+        session.received[index] = 1
+        session.updated_at = time.monotonic()
+        return session
+
+    async def finalize(self, upload_id: str, checksum: str, algorithm: str = "sha256") -> None:
+        """
+        Verify the assembled file and commit it as the user's asset.
+
+        Raises:
+            KeyError: If the session does not exist.
+            UploadBusyError: If the session is already being finalized or
+                chunk writes are still in flight.
+            ValueError: If chunks are missing or the checksum does not match.
+        """
+        session = self.__sessions[upload_id]
+        if session.finalizing:
+            raise UploadBusyError(f"Upload {upload_id} is already being finalized.")
+        if session.writes:
+            # a chunk still being written could land after the file is hashed
+            raise UploadBusyError(f"Upload {upload_id} has chunk writes in flight.")
+        if not session.is_complete():
+            raise ValueError(f"Missing chunks: {session.get_missing()}")
+        if algorithm not in UploadManager.ALGORITHMS:
+            raise ValueError(f"Unsupported checksum algorithm: {algorithm}")
+
+        # the part file belongs to this call until it is installed or dropped
+        session.finalizing = True
+        try:
+            await self.__finalize(session, checksum, algorithm)
+        finally:
+            session.finalizing = False
+            session.updated_at = time.monotonic()
+
+    async def __finalize(
+        self, session: UploadSession, checksum: str, algorithm: str
+    ) -> None:
+
+        def digest() -> tuple[str, str]:
+            expected = hashlib.new(algorithm)
+            stored = hashlib.blake2b(digest_size=16)
+            with open(session.path, "rb") as f:
+                while chunk := f.read(UserData.BUFFER_SIZE):
+                    expected.update(chunk)
+                    stored.update(chunk)
+                os.fsync(f.fileno())
+            return expected.hexdigest(), stored.hexdigest()
+
+        actual, stored = await asyncio.to_thread(digest)
+        if actual != checksum.lower():
+            await self.__discard(session)
+            raise ValueError("Checksum mismatch, upload discarded.")
+
+        self.__sessions.pop(session.upload_id, None)
+        await self.__db.install_asset(
+            session.user_id, session.file_type, session.path, session.size, stored
+        )
+        self.__logger.log(
+            f"Chunked upload of {session.file_type} for {session.user_id} committed",
+            LogLevel.INFO,
+        )
+
+    async def abort(self, upload_id: str) -> bool:
+        """
+        Raises:
+            UploadBusyError: If the session is being finalized.
+        """
+        session = self.__sessions.get(upload_id)
+        if session is None:
+            return False
+        if session.finalizing:
+            raise UploadBusyError(f"Upload {upload_id} is being finalized.")
+
+        await self.__discard(session)
+        return True
@@ -0,0 +1,164 @@
+import asyncio
+import time
+from typing import Iterable
+
+from pylognet.client import LoggingClient, LogLevel
+
+
+class Subscription:
+    """
+    One listener on the event bus with its own bounded queue.
+    """
+
+    __slots__ = ("user_ids", "queue", "queue_size", "dropped")
+
+    def __init__(self, user_ids: set[str] | None, queue_size: int) -> None:
+        self.user_ids = user_ids
+        # bounded by put, which lets terminal events through when full
+        self.queue: asyncio.Queue[dict] = asyncio.Queue()
+        self.queue_size = max(1, queue_size)
+        self.dropped = 0
+
+    def __is_protected(self, event: dict) -> bool:
+        # streams of specific users close on these, so they must arrive;
+        # a stream of all users never closes and has nothing to protect
+        return self.user_ids is not None and event["event"] in EventBus.TERMINAL
+
+    def put(self, event: dict) -> None:
+        if self.queue.qsize() < self.queue_size:
+            self.queue.put_nowait(event)
+            return
+
+        # a stalled client loses its oldest progress events rather than
+        # holding up the publisher
+        queued = [self.queue.get_nowait() for _ in range(self.queue.qsize())]
+        for i, old in enumerate(queued):
+            if not self.__is_protected(old):
+                del queued[i]
+                queued.append(event)
+                self.dropped += 1
+                break
+        else:
+            # only terminal events are queued, at most a few per watched user
+            if self.__is_protected(event):
+                queued.append(event)
+            else:
+                self.dropped += 1
+        for old in queued:
+            self.queue.put_nowait(old)
+
+    async def get(self, timeout: float) -> dict | None:
+        """
+        Wait for the next event.
+
+        Returns:
+            dict | None: The event, or None if nothing arrived within timeout.
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBus:
+    """
+    In-process publish/subscribe for per-user progress events, fanned out
+    to SSE and WebSocket clients.
+    """
+
+    # events after which a user's progress can no longer change
+    TERMINAL = ("ready", "failed", "removed")
+
+    def __init__(
+        self,
+        config: dict,
+        logger: LoggingClient,
+        debug_mode: bool = False,
+    ) -> None:
+        self.__debug = debug_mode
+        self.__logger = logger
+        self.__config = config.get("events", {})
+        self.__queue_size = int(self.__config.get("queue_size", 256))
+        self.__keepalive = float(self.__config.get("keepalive", 15))
+        self.__seq = 0
+        self.__by_user: dict[str, set[Subscription]] = {}
+        self.__all: set[Subscription] = set()
+        self.__published = 0
+
+    def get_keepalive(self) -> float:
+        return self.__keepalive
+
+    def subscribe(self, user_ids: Iterable[str] | None = None) -> Subscription:
+        """
+        Start receiving events.
+
+        Args:
+            user_ids (Iterable[str] | None): UUIDs to follow, or None for all users.
+
+        Returns:
+            Subscription: Pass it to `unsubscribe` when done.
+        """
+        ids = set(user_ids) if user_ids is not None else None
+        subscription = Subscription(ids, self.__queue_size)
+        if ids is None:
+            self.__all.add(subscription)
+        else:
+            for user_id in ids:
+                self.__by_user.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        if subscription.user_ids is None:
+            self.__all.discard(subscription)
+            return
+
+        for user_id in subscription.user_ids:
+            subscribers = self.__by_user.get(user_id)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self.__by_user[user_id]
+
+        if subscription.dropped:
+            self.__logger.log(
+                f"Event subscriber dropped {subscription.dropped} events",
+                LogLevel.WARNING,
+            )
+
+    def make_event(self, user_id: str, event: str, data: dict) -> dict:
+        self.__seq += 1
+        return {
+            "id": self.__seq,
+            "event": event,
+            "uuid": user_id,
+            "time": time.time(),
+            **data,
+        }
+
+    def publish(self, user_id: str, event: str, data: dict) -> None:
+        """
+        Deliver an event to every matching subscriber. Must be called on the
+        event loop; never blocks.
+        """
+        subscribers = self.__by_user.get(user_id, set()) | self.__all
+        if not subscribers:
+            return
+
+        message = self.make_event(user_id, event, data)
+        for subscription in subscribers:
+            subscription.put(message)
+        self.__published += 1
+
+        if self.__debug:
+            self.__logger.log(
+                f"Event {event} for {user_id} sent to {len(subscribers)} subscribers",
+                LogLevel.DEBUG,
+            )
+
+    def get_stats(self) -> dict:
+        return {
+            "subscribers": len(self.__all)
+            + len({s for subs in self.__by_user.values() for s in subs}),
+            "published": self.__published,
+        }
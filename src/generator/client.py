@@ -0,0 +1,88 @@
+import httpx
+import time
+
+from pylognet.client import LoggingClient, LogLevel
+
+from metrics.registry import REGISTRY
+
+GENERATOR_SECONDS = REGISTRY.histogram(
+    "generator_request_seconds",
+    "Generator POST latency by generator and outcome",
+    ("generator", "outcome"),
+)
+
+
+class GeneratorClient:
+    """
+    Shared, connection-pooled async HTTP client for the remote generators.
+
+    A single `httpx.AsyncClient` is reused for every dispatch so that
+    connections to the model and audio generators are kept alive between
+    requests instead of being re-established for each job.
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        logger: LoggingClient,
+        debug_mode: bool = False,
+    ) -> None:
+        self.__debug = debug_mode
+        self.__logger = logger
+        self.__config = config.get("generator", {})
+        self.__timeouts = self.__config.get("timeouts", {})
+
+        pool_size = int(self.__config.get("pool_size", 10))
+        keepalive = float(self.__config.get("keepalive", 30.0))
+        self.__client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=keepalive,
+            ),
+            timeout=httpx.Timeout(float(self.__timeouts.get("default", 30.0))),
+        )
+
+    def __get_timeout(self, name: str) -> httpx.Timeout:
+        timeout = float(
+            self.__timeouts.get(name, self.__timeouts.get("default", 30.0))
+        )
+        connect = float(self.__timeouts.get("connect", 5.0))
+        return httpx.Timeout(timeout, connect=connect)
+
+    async def post(
+        self, name: str, url: str, data: dict, headers: dict | None = None
+    ) -> httpx.Response | None:
+        """
+        POST a JSON payload to a generator endpoint using the shared pool.
+
+        Args:
+            name (str): Generator name used to look up its timeout (e.g. "model").
+            url (str): Target URL.
+            data (dict): JSON payload.
+            headers (dict | None): Extra request headers, e.g. `traceparent`.
+
+        Returns:
+            httpx.Response | None: The response, or None in debug mode.
+        """
+        if self.__debug:
+            self.__logger.log(
+                f"POST request to {url} with {data}",
+                LogLevel.DEBUG,
+            )
+            return None
+
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await self.__client.post(
+                url, json=data, headers=headers, timeout=self.__get_timeout(name)
+            )
+            response.raise_for_status()
+            outcome = "ok"
+            return response
+        finally:
+            GENERATOR_SECONDS.labels(name, outcome).observe(time.perf_counter() - start)
+
+    async def close(self) -> None:
+        await self.__client.aclose()
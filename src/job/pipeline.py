@@ -0,0 +1,344 @@
+import asyncio
+import time
+
+from collections import OrderedDict
+from typing import Callable
+
+from pylognet.client import LoggingClient, LogLevel
+
+
+class PipelineRun:
+    """
+    Progress of one user through the generation pipeline.
+    """
+
+    __slots__ = (
+        "uuid",
+        "stage",
+        "times",
+        "assets",
+        "prompt",
+        "dispatches",
+        "reason",
+        "timer",
+        "retry",
+    )
+
+    def __init__(self, user_id: str, stage: str) -> None:
+        self.uuid = user_id
+        self.stage = stage
+        self.times: dict[str, float] = {stage: time.time()}
+        self.assets: set[str] = set()
+        self.prompt = ""
+        self.dispatches = 0
+        self.reason = ""
+        self.timer: asyncio.TimerHandle | None = None
+        self.retry: asyncio.TimerHandle | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "uuid": self.uuid,
+            "stage": self.stage,
+            "times": self.times,
+            "assets": sorted(self.assets),
+            "dispatches": self.dispatches,
+            "reason": self.reason,
+        }
+
+
+class Pipeline:
+    """
+    Per-user state machine:
+
+        requested -> llm_done -> dispatched -> assets -> ready -> notified
+                                                     any -> failed
+
+    Transitions only move forward and all run on the event loop, so each
+    completion hook fires exactly once per user. Every stage has a
+    deadline; a user stuck in dispatched/assets is re-dispatched for the
+    assets still missing, and failed once the retries are used up.
+    """
+
+    REQUESTED = "requested"
+    LLM_DONE = "llm_done"
+    DISPATCHED = "dispatched"
+    ASSETS = "assets"
+    READY = "ready"
+    NOTIFIED = "notified"
+    FAILED = "failed"
+    STAGES = (REQUESTED, LLM_DONE, DISPATCHED, ASSETS, READY, NOTIFIED)
+    TERMINAL = (NOTIFIED, FAILED)
+
+    # default deadline in seconds for leaving each stage
+    DEADLINES = {
+        REQUESTED: 180,
+        LLM_DONE: 60,
+        DISPATCHED: 600,
+        ASSETS: 600,
+    }
+
+    # durations reported by get_stats
+    SEGMENTS = (
+        (REQUESTED, LLM_DONE),
+        (LLM_DONE, DISPATCHED),
+        (DISPATCHED, READY),
+        (READY, NOTIFIED),
+        (REQUESTED, NOTIFIED),
+    )
+
+    def __init__(
+        self,
+        config: dict,
+        logger: LoggingClient,
+        debug_mode: bool = False,
+    ) -> None:
+        self.__debug = debug_mode
+        self.__logger = logger
+        self.__config = config.get("pipeline", {})
+        self.__deadlines = {
+            **Pipeline.DEADLINES,
+            **{k: float(v) for k, v in self.__config.get("deadlines", {}).items()},
+        }
+        self.__max_dispatches = int(self.__config.get("max_dispatches", 3))
+        self.__retry_delay = float(self.__config.get("retry_delay", 10))
+        self.__history_size = int(self.__config.get("history", 1024))
+
+        self.__runs: dict[str, PipelineRun] = {}
+        self.__history: OrderedDict[str, PipelineRun] = OrderedDict()
+        self.__durations = {
+            f"{start}->{end}": [0, 0.0, 0.0] for start, end in Pipeline.SEGMENTS
+        }
+        self.__redispatched = 0
+        self.__expired = 0
+
+        self.__on_dispatch: Callable[[str, str, set[str]], None] | None = None
+        self.__on_ready: Callable[[str], bool] | None = None
+        self.__on_failed: Callable[[str, str], None] | None = None
+
+    def set_hooks(
+        self,
+        on_dispatch: Callable[[str, str, set[str]], None],
+        on_ready: Callable[[str], bool],
+        on_failed: Callable[[str, str], None],
+    ) -> None:
+        """
+        Args:
+            on_dispatch: `(user_id, prompt, arrived_assets)`, (re-)sends the
+                generator requests for the assets not yet arrived.
+            on_ready: `(user_id)`, called once when all assets are in;
+                returns whether the user was notified.
+            on_failed: `(user_id, reason)`, called once when a user fails.
+        """
+        self.__on_dispatch = on_dispatch
+        self.__on_ready = on_ready
+        self.__on_failed = on_failed
+
+    def __arm(self, run: PipelineRun, delay: float | None = None) -> None:
+        if run.timer is not None:
+            run.timer.cancel()
+            run.timer = None
+
+        if delay is None:
+            delay = self.__deadlines.get(run.stage)
+        if delay is not None and delay > 0:
+            loop = asyncio.get_running_loop()
+            run.timer = loop.call_later(delay, self.__expire, run.uuid, run.stage)
+
+    def __advance(self, run: PipelineRun, stage: str) -> bool:
+        if run.stage in Pipeline.TERMINAL:
+            return False
+        if stage != Pipeline.FAILED and (
+            Pipeline.STAGES.index(stage) <= Pipeline.STAGES.index(run.stage)
+        ):
+            return False
+
+        run.stage = stage
+        run.times.setdefault(stage, time.time())
+        self.__arm(run)
+
+        if run.retry is not None and stage in (Pipeline.READY, *Pipeline.TERMINAL):
+            run.retry.cancel()
+            run.retry = None
+        if stage in Pipeline.TERMINAL:
+            self.__finish(run)
+        return True
+
+    def __finish(self, run: PipelineRun) -> None:
+        self.__runs.pop(run.uuid, None)
+        for start, end in Pipeline.SEGMENTS:
+            if start in run.times and end in run.times:
+                stats = self.__durations[f"{start}->{end}"]
+                duration = run.times[end] - run.times[start]
+                stats[0] += 1
+                stats[1] += duration
+                stats[2] = max(stats[2], duration)
+
+        self.__history[run.uuid] = run
+        while len(self.__history) > self.__history_size:
+            self.__history.popitem(last=False)
+
+    def __get_run(
+        self, user_id: str, stage: str, arm: bool = True
+    ) -> PipelineRun | None:
+        # users created before a restart or outside /request join mid-way,
+        # but a run that already finished is never started over
+        if (run := self.__runs.get(user_id)) is None:
+            if user_id in self.__history:
+                return None
+            run = PipelineRun(user_id, stage)
+            self.__runs[user_id] = run
+            if arm:
+                self.__arm(run)
+        return run
+
+    def __expire(self, user_id: str, stage: str) -> None:
+        run = self.__runs.get(user_id)
+        if run is None or run.stage != stage:
+            return
+
+        run.timer = None
+        self.__expired += 1
+        if stage in (Pipeline.DISPATCHED, Pipeline.ASSETS):
+            if run.dispatches < self.__max_dispatches:
+                self.__logger.log(
+                    f"Assets for {user_id} overdue in {stage}, re-dispatching",
+                    LogLevel.WARNING,
+                )
+                self.__redispatch(user_id)
+                return
+
+        self.fail(user_id, f"deadline exceeded in {stage}")
+
+    def __redispatch(self, user_id: str) -> None:
+        run = self.__runs.get(user_id)
+        if run is None or run.stage not in (Pipeline.DISPATCHED, Pipeline.ASSETS):
+            return
+
+        if run.retry is not None:
+            run.retry.cancel()
+            run.retry = None
+        run.dispatches += 1
+        self.__redispatched += 1
+        self.__arm(run)
+        if self.__on_dispatch is not None:
+            self.__on_dispatch(user_id, run.prompt, set(run.assets))
+
+    def requested(self, user_id: str) -> None:
+        """
+        A user was registered and its LLM job queued. The REQUESTED
+        deadline only starts with `llm_started`, so time spent waiting in
+        a busy queue does not fail the user.
+        """
+        self.__get_run(user_id, Pipeline.REQUESTED, arm=False)
+
+    def llm_started(self, user_id: str) -> None:
+        run = self.__get_run(user_id, Pipeline.REQUESTED)
+        if run is not None and run.stage == Pipeline.REQUESTED and run.timer is None:
+            self.__arm(run)
+
+    def llm_done(self, user_id: str, prompt: str) -> None:
+        if (run := self.__get_run(user_id, Pipeline.REQUESTED)) is None:
+            return
+        run.prompt = prompt
+        self.__advance(run, Pipeline.LLM_DONE)
+
+    def dispatched(self, user_id: str) -> None:
+        """
+        The generator requests for a user are being sent. Re-dispatches
+        report here too but do not move the stage back.
+        """
+        run = self.__runs.get(user_id)
+        if run is not None and self.__advance(run, Pipeline.DISPATCHED):
+            run.dispatches += 1
+
+    def dispatch_failed(self, user_id: str, reason: str) -> None:
+        """
+        A generator request failed; retry after `retry_delay` unless the
+        dispatch budget is spent.
+        """
+        run = self.__runs.get(user_id)
+        if run is None:
+            # not tracked, so nothing will retry it
+            if self.__on_failed is not None:
+                self.__on_failed(user_id, reason)
+            return
+        if run.stage not in (Pipeline.DISPATCHED, Pipeline.ASSETS):
+            return
+
+        run.reason = reason
+        if run.dispatches >= self.__max_dispatches:
+            self.fail(user_id, reason)
+            return
+        if run.retry is None:
+            # both generators failing at once still means one retry
+            loop = asyncio.get_running_loop()
+            run.retry = loop.call_later(self.__retry_delay, self.__redispatch, user_id)
+
+    def resume(self, user_id: str, prompt: str, assets: set[str]) -> None:
+        """
+        Reattach a user left pending by a restart whose LLM step had
+        finished, and re-dispatch the assets it is still missing.
+        """
+        if user_id in self.__runs or user_id in self.__history:
+            return
+
+        run = PipelineRun(user_id, Pipeline.DISPATCHED)
+        run.prompt = prompt
+        run.assets = set(assets)
+        self.__runs[user_id] = run
+        self.__redispatch(user_id)
+
+    def asset_arrived(self, user_id: str, asset: str) -> None:
+        if (run := self.__runs.get(user_id)) is None:
+            return
+
+        run.assets.add(asset)
+        if run.stage in (Pipeline.DISPATCHED, Pipeline.LLM_DONE):
+            self.__advance(run, Pipeline.ASSETS)
+
+    def ready(self, user_id: str) -> None:
+        run = self.__get_run(user_id, Pipeline.ASSETS)
+        if run is None or not self.__advance(run, Pipeline.READY):
+            return
+
+        notified = self.__on_ready(user_id) if self.__on_ready is not None else False
+        if notified:
+            self.__advance(run, Pipeline.NOTIFIED)
+        else:
+            self.__finish(run)
+
+    def fail(self, user_id: str, reason: str) -> None:
+        run = self.__runs.get(user_id)
+        if run is None:
+            return
+
+        run.reason = reason
+        if not self.__advance(run, Pipeline.FAILED):
+            return
+
+        self.__logger.log(f"Pipeline failed for {user_id}: {reason}", LogLevel.ERROR)
+        if self.__on_failed is not None:
+            self.__on_failed(user_id, reason)
+
+    def get(self, user_id: str) -> dict | None:
+        run = self.__runs.get(user_id) or self.__history.get(user_id)
+        return run.to_dict() if run is not None else None
+
+    def get_stats(self) -> dict:
+        stages: dict[str, int] = {}
+        for run in self.__runs.values():
+            stages[run.stage] = stages.get(run.stage, 0) + 1
+
+        return {
+            "active": stages,
+            "redispatched": self.__redispatched,
+            "expired": self.__expired,
+            "durations": {
+                segment: {
+                    "count": count,
+                    "avg": total / count if count else 0.0,
+                    "max": longest,
+                }
+                for segment, (count, total, longest) in self.__durations.items()
+            },
+        }
@@ -0,0 +1,208 @@
+import asyncio
+import inspect
+import math
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from pylognet.client import LoggingClient, LogLevel
+
+
+class QueueFullError(Exception):
+    def __init__(self, stage: str, retry_after: int) -> None:
+        super().__init__(f"Job queue '{stage}' is full")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class JobQueue:
+    """
+    Bounded job queue for a single pipeline stage.
+
+    Jobs are drained by a fixed number of worker tasks. Coroutine functions
+    are awaited on the event loop, plain functions run on a thread pool sized
+    to the stage concurrency.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        logger: LoggingClient,
+        concurrency: int = 1,
+        max_depth: int = 100,
+    ) -> None:
+        self.__name = name
+        self.__logger = logger
+        self.__concurrency = max(1, concurrency)
+        self.__max_depth = max(1, max_depth)
+        self.__queue: asyncio.Queue = asyncio.Queue(maxsize=self.__max_depth)
+        self.__executor = ThreadPoolExecutor(
+            max_workers=self.__concurrency, thread_name_prefix=f"job-{name}"
+        )
+        self.__workers: list[asyncio.Task] = []
+
+        self.__submitted = 0
+        self.__completed = 0
+        self.__failed = 0
+        self.__rejected = 0
+        self.__running = 0
+        self.__wait_total = 0.0
+        self.__wait_max = 0.0
+        self.__run_total = 0.0
+
+    def get_name(self) -> str:
+        return self.__name
+
+    def start(self) -> None:
+        if self.__workers:
+            return
+
+        for _ in range(self.__concurrency):
+            self.__workers.append(asyncio.create_task(self.__worker()))
+
+    async def stop(self) -> None:
+        for worker in self.__workers:
+            worker.cancel()
+        await asyncio.gather(*self.__workers, return_exceptions=True)
+        self.__workers = []
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+
+    def is_full(self) -> bool:
+        return self.__queue.full()
+
+    def get_retry_after(self) -> int:
+        """
+        Estimate how many seconds a rejected client should wait before retrying.
+        """
+        done = self.__completed + self.__failed
+        avg_run = self.__run_total / done if done else 1.0
+        pending = self.__queue.qsize() + self.__running
+        return max(1, math.ceil(avg_run * pending / self.__concurrency))
+
+    def submit(self, func: Callable[..., Any], *args: Any) -> None:
+        """
+        Enqueue a job without waiting.
+
+        Raises:
+            QueueFullError: If the queue has reached its maximum depth.
+        """
+        try:
+            self.__queue.put_nowait((time.monotonic(), func, args))
+        except asyncio.QueueFull:
+            self.__rejected += 1
+            raise QueueFullError(self.__name, self.get_retry_after())
+
+        self.__submitted += 1
+
+    async def enqueue(self, func: Callable[..., Any], *args: Any) -> None:
+        """
+        Enqueue a job, waiting for free space if the queue is full.
+        """
+        await self.__queue.put((time.monotonic(), func, args))
+        self.__submitted += 1
+
+    async def __run(self, func: Callable[..., Any], args: tuple) -> None:
+        if inspect.iscoroutinefunction(func):
+            await func(*args)
+        else:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.__executor, func, *args)
+
+    async def __worker(self) -> None:
+        while True:
+            enqueued_at, func, args = await self.__queue.get()
+            started_at = time.monotonic()
+            wait = started_at - enqueued_at
+            self.__wait_total += wait
+            self.__wait_max = max(self.__wait_max, wait)
+            self.__running += 1
+
+            try:
+                await self.__run(func, args)
+                self.__completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.__failed += 1
+                self.__logger.log(
+                    f"Job {getattr(func, '__name__', func)} in queue '{self.__name}' failed: {e}",
+                    LogLevel.ERROR,
+                )
+            finally:
+                self.__running -= 1
+                self.__run_total += time.monotonic() - started_at
+                self.__queue.task_done()
+
+    def get_stats(self) -> dict:
+        started = self.__completed + self.__failed + self.__running
+        return {
+            "depth": self.__queue.qsize(),
+            "max_depth": self.__max_depth,
+            "concurrency": self.__concurrency,
+            "running": self.__running,
+            "submitted": self.__submitted,
+            "completed": self.__completed,
+            "failed": self.__failed,
+            "rejected": self.__rejected,
+            "wait_avg": self.__wait_total / started if started else 0.0,
+            "wait_max": self.__wait_max,
+        }
+
+
+class JobScheduler:
+    LLM = "llm"
+    GENERATOR = "generator"
+
+    DEFAULTS = {
+        LLM: {"concurrency": 8, "max_depth": 64},
+        GENERATOR: {"concurrency": 8, "max_depth": 256},
+    }
+
+    def __init__(
+        self,
+        config: dict,
+        logger: LoggingClient,
+        debug_mode: bool = False,
+    ) -> None:
+        self.__debug = debug_mode
+        self.__logger = logger
+        self.__config = config.get("jobs", {})
+        self.__queues: dict[str, JobQueue] = {}
+
+        for stage, defaults in JobScheduler.DEFAULTS.items():
+            stage_config = self.__config.get(stage, {})
+            self.__queues[stage] = JobQueue(
+                stage,
+                self.__logger,
+                concurrency=int(
+                    stage_config.get("concurrency", defaults["concurrency"])
+                ),
+                max_depth=int(stage_config.get("max_depth", defaults["max_depth"])),
+            )
+
+    def get_queue(self, stage: str) -> JobQueue:
+        if stage not in self.__queues.keys():
+            raise ValueError(f"Unknown job stage: {stage}")
+
+        return self.__queues[stage]
+
+    def start(self) -> None:
+        for queue in self.__queues.values():
+            queue.start()
+
+    async def stop(self) -> None:
+        for queue in self.__queues.values():
+            await queue.stop()
+
+    def is_full(self, stage: str) -> bool:
+        return self.get_queue(stage).is_full()
+
+    def submit(self, stage: str, func: Callable[..., Any], *args: Any) -> None:
+        self.get_queue(stage).submit(func, *args)
+
+    async def enqueue(self, stage: str, func: Callable[..., Any], *args: Any) -> None:
+        await self.get_queue(stage).enqueue(func, *args)
+
+    def get_stats(self) -> dict:
+        return {stage: queue.get_stats() for stage, queue in self.__queues.items()}
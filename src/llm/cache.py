@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import unicodedata
+
+from collections import OrderedDict
+
+from pylognet.client import LoggingClient, LogLevel
+
+
+def normalize_query(query: str) -> str:
+    """
+    Fold the notational variants the system prompt tells the LLM to ignore.
+
+    Full-width/half-width forms are unified with NFKC, hiragana is folded to
+    katakana, case is folded and whitespace and punctuation are dropped.
+
+    Args:
+        query (str): The raw user query.
+
+    Returns:
+        str: The normalized query.
+    """
+    text = unicodedata.normalize("NFKC", query).casefold()
+    folded = []
+    for ch in text:
+        code = ord(ch)
+        # hiragana (U+3041..U+3096) -> katakana (U+30A1..U+30F6)
+        if 0x3041 <= code <= 0x3096:
+            ch = chr(code + 0x60)
+        category = unicodedata.category(ch)
+        if category[0] in ("Z", "P", "C"):
+            continue
+        folded.append(ch)
+    return "".join(folded)
+
+
+class LLMCache:
+    """
+    In-memory LRU cache for LLM responses backed by an on-disk SQLite store.
+
+    Entries survive restarts through the SQLite file; the most recently used
+    entries are also kept in memory so hits never touch the disk. Disk
+    lookups and writes run in worker threads, off the event loop.
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        logger: LoggingClient,
+        debug_mode: bool = False,
+    ) -> None:
+        self.__debug = debug_mode
+        self.__logger = logger
+        self.__config = config.get("ollama", {}).get("cache", {})
+        self.__enabled = bool(self.__config.get("enabled", True))
+        self.__max_size = int(self.__config.get("size", 1024))
+
+        db_path = os.path.expanduser(config.get("db", {}).get("path", "~/YummyVerse"))
+        self.__path = os.path.expanduser(
+            self.__config.get("path", os.path.join(db_path, "llm_cache.db"))
+        )
+
+        # __lock guards the in-memory LRU and counters, __db_lock the connection
+        self.__lock = threading.Lock()
+        self.__db_lock = threading.Lock()
+        self.__memory: OrderedDict[str, dict] = OrderedDict()
+        self.__hits = 0
+        self.__disk_hits = 0
+        self.__misses = 0
+
+        self.__conn: sqlite3.Connection | None = None
+        if self.__enabled:
+            self.__conn = self.__open()
+
+    def __open(self) -> sqlite3.Connection | None:
+        try:
+            os.makedirs(os.path.dirname(self.__path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.__path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # a lost entry only costs an LLM call; avoid an fsync per insert
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            conn.commit()
+            return conn
+        except sqlite3.Error as e:
+            self.__logger.log(
+                f"Failed to open LLM cache at {self.__path}, using memory only: {e}",
+                LogLevel.WARNING,
+            )
+            return None
+
+    @staticmethod
+    def make_key(
+        query: str,
+        model: str,
+        prompt_hash: str,
+        temperature: float,
+    ) -> str:
+        """
+        Build the cache key for a single LLM call.
+
+        Args:
+            query (str): The raw user query; it is normalized before hashing.
+            model (str): The Ollama model name.
+            prompt_hash (str): Hash of the system prompt.
+            temperature (float): Sampling temperature.
+
+        Returns:
+            str: A hex digest identifying the call.
+        """
+        payload = json.dumps(
+            [normalize_query(query), model, prompt_hash, temperature],
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def is_enabled(self) -> bool:
+        return self.__enabled
+
+    def __select(self, key: str) -> dict | None:
+        with self.__db_lock:
+            row = self.__conn.execute(
+                "SELECT value FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def __insert(self, key: str, value: str) -> None:
+        try:
+            with self.__db_lock:
+                self.__conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)",
+                    (key, value),
+                )
+                self.__conn.commit()
+        except sqlite3.Error as e:
+            self.__logger.log(
+                f"Failed to persist LLM cache entry: {e}", LogLevel.WARNING
+            )
+
+    async def get(self, key: str) -> dict | None:
+        if not self.__enabled:
+            return None
+
+        with self.__lock:
+            if key in self.__memory:
+                self.__memory.move_to_end(key)
+                self.__hits += 1
+                return self.__memory[key]
+
+        value = None
+        if self.__conn is not None:
+            try:
+                value = await asyncio.to_thread(self.__select, key)
+            except sqlite3.Error as e:
+                self.__logger.log(f"Failed to read LLM cache: {e}", LogLevel.WARNING)
+
+        with self.__lock:
+            if value is None:
+                self.__misses += 1
+                return None
+
+            self.__hits += 1
+            self.__disk_hits += 1
+            self.__remember(key, value)
+            return value
+
+    async def put(self, key: str, value: dict) -> None:
+        if not self.__enabled:
+            return
+
+        with self.__lock:
+            self.__remember(key, value)
+        if self.__conn is not None:
+            await asyncio.to_thread(
+                self.__insert, key, json.dumps(value, ensure_ascii=False)
+            )
+
+    def __remember(self, key: str, value: dict) -> None:
+        self.__memory[key] = value
+        self.__memory.move_to_end(key)
+        while len(self.__memory) > self.__max_size:
+            self.__memory.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            lookups = self.__hits + self.__misses
+            return {
+                "enabled": self.__enabled,
+                "persistent": self.__conn is not None,
+                "size": len(self.__memory),
+                "max_size": self.__max_size,
+                "hits": self.__hits,
+                "disk_hits": self.__disk_hits,
+                "misses": self.__misses,
+                "hit_rate": self.__hits / lookups if lookups else 0.0,
+            }
@@ -1,10 +1,23 @@
-import os
 import json
-from ollama import Client
+import math
+import time
+import numpy as np
 from pydantic import BaseModel
 from pylognet.client import LoggingClient
 from pylognet.client import LogLevel
 
+from llm.cache import LLMCache
+from llm.dispatcher import LLMDispatcher
+from llm.prompt import Prompt, PromptStore
+from llm.stream import JSONObjectScanner
+from metrics.registry import REGISTRY
+
+CHOOSE_DISH_SECONDS = REGISTRY.histogram(
+    "llm_choose_dish_seconds",
+    "LLMController.choose_dish latency by result status",
+    ("status",),
+)
+
 
 class TopNames(BaseModel):
     first: str
@@ -22,6 +35,54 @@ class ResponseModel(BaseModel):
     error: str = ""
 
 
+class CandidateMatcher:
+    """
+    Picks the candidates nearest to an estimated texture by L1 distance over
+    (chewiness, firmness).
+    """
+
+    def __init__(self, candidates: list[dict], review_margin: int = 0) -> None:
+        self.__names = [candidate["name"] for candidate in candidates]
+        self.__points = np.array(
+            [[candidate["chewiness"], candidate["firmness"]] for candidate in candidates],
+            dtype=np.float32,
+        )
+        self.__review_margin = review_margin
+
+    def match(self, response: ResponseModel) -> ResponseModel:
+        """
+        Fill in status, best_name and top_names from the estimated texture.
+
+        The match is "ok" when the nearest candidate is closer than the
+        runner-up by more than the review margin, otherwise "review" with up
+        to three candidates ordered by distance.
+
+        Args:
+            response (ResponseModel): Response holding the estimated chewiness
+                and firmness.
+
+        Returns:
+            ResponseModel: The same response with the match filled in.
+        """
+        query = np.array([response.chewiness, response.firmness], dtype=np.float32)
+        distances = np.abs(self.__points - query).sum(axis=1)
+
+        k = min(3, len(self.__names))
+        nearest = np.argpartition(distances, k - 1)[:k]
+        # order by distance, ties broken by position in the candidate list
+        nearest = nearest[np.lexsort((nearest, distances[nearest]))]
+
+        if k == 1 or distances[nearest[1]] - distances[nearest[0]] > self.__review_margin:
+            response.status = "ok"
+            response.best_name = self.__names[nearest[0]]
+        else:
+            names = [self.__names[i] for i in nearest] + ["", ""]
+            response.status = "review"
+            response.top_names = TopNames(first=names[0], second=names[1], third=names[2])
+
+        return response
+
+
 class LLMController:
     def __init__(
         self,
@@ -31,14 +92,28 @@ class LLMController:
     ):
         self.__debug = debug_mode
         self.__logger = logger
-        self.__endpoint = config.get("endpoints", {})
         self.__config = config.get("ollama", {})
-        self.__candidates = self.__config.get("candidates", [])
-        self.__client = self.__get_client()
+        self.__prompt = PromptStore(config, logger, debug_mode)
+        self.__dispatcher = LLMDispatcher(config, logger, debug_mode)
+        self.__cache = LLMCache(config, logger, debug_mode)
+        self.__matcher: CandidateMatcher | None = None
+        self.__matcher_version: tuple = ()
+
+    def __get_matcher(self, prompt: Prompt) -> CandidateMatcher:
+        if self.__matcher is None or self.__matcher_version != prompt.version:
+            self.__matcher = CandidateMatcher(
+                prompt.candidates, int(self.__config.get("review_margin", 0))
+            )
+            self.__matcher_version = prompt.version
+        return self.__matcher
 
-    def __get_client(self) -> Client:
-        ollama_endpoint = self.__endpoint.get("ollama", "http://localhost:11434")
-        return Client(ollama_endpoint)
+    @staticmethod
+    def __to_score(value) -> int:
+        score = float(value)
+        # json.loads accepts NaN and Infinity, which no score can hold
+        if math.isnan(score):
+            raise ValueError(f"Score is not a number: {value}")
+        return min(10, max(1, round(score)))
 
     def __extract_json_block(self, text: str) -> ResponseModel:
         """
@@ -51,37 +126,29 @@ class LLMController:
             ResponseModel: The parsed JSON block as a ResponseModel object.
         """
         try:
-            # if text contains ```json ... ``` block, extract it
-            json_block = ""
-            if text.startswith("```json"):
-                json_block = text[7:-3].strip()
-            elif text.startswith("```"):
-                json_block = text[3:-3].strip()
-            else:
+            # take the first {...} object, whether fenced or not, and ignore
+            # anything the model adds after it
+            json_block = JSONObjectScanner().feed(text)
+            if json_block is None:
                 raise ValueError("No JSON block found")
 
             data = json.loads(json_block)
 
             response = ResponseModel()
-            response.status = data.get("status", "")
-            response.chewiness = data.get("chewiness", 5)
-            response.firmness = data.get("firmness", 5)
+            response.chewiness = self.__to_score(data["chewiness"])
+            response.firmness = self.__to_score(data["firmness"])
             response.translated = data.get("translated", "")
 
-            if response.status == "ok":
-                response.best_name = data.get("best_name", "")
-            else:
-                top_names = data.get("top_names", [])
-                response.top_names = TopNames(
-                    first=top_names[0] if len(top_names) > 0 else "",
-                    second=top_names[1] if len(top_names) > 1 else "",
-                    third=top_names[2] if len(top_names) > 2 else "",
-                )
-
             response.error = "no error"
             return response
 
-        except (json.JSONDecodeError, KeyError, ValueError) as e:
+        except (
+            json.JSONDecodeError,
+            KeyError,
+            TypeError,
+            ValueError,
+            OverflowError,
+        ) as e:
             # if JSON parsing fails, return an error response
             return ResponseModel(
                 status="error",
@@ -93,59 +160,89 @@ class LLMController:
                 error=f"Failed to parse JSON response: {str(e)}",
             )
 
-    def choose_dish(self, user_request: str) -> ResponseModel:
+    async def choose_dish(self, user_request: str) -> ResponseModel:
         """
-        Calls the LLM to choose the best dish name based on user request and candidates.
+        Calls the LLM to estimate the texture of the user request and matches
+        it against the candidates locally.
 
         Args:
             user_request (str): The user's request or description.
         Returns:
             ResponseModel: The response from the LLM containing the best dish name and other details.
         """
-        ollama_model = self.__config.get("model", "gemma3:12b")
-        prompt_path = self.__config.get("prompt", "")
-        system_prompt = ""
-
-        if not prompt_path or not os.path.exists(prompt_path):
-            raise FileNotFoundError("System prompt file not found")
+        start = time.perf_counter()
+        status = "exception"
+        try:
+            response = await self.__choose_dish(user_request)
+            status = response.status or "ok"
+            return response
+        finally:
+            CHOOSE_DISH_SECONDS.labels(status).observe(time.perf_counter() - start)
 
-        with open(prompt_path, "rb") as f:
-            system_prompt = f.read()
+    async def __choose_dish(self, user_request: str) -> ResponseModel:
+        ollama_model = self.__config.get("model", "gemma3:12b")
+        prompt = self.__prompt.get()
 
         temperature = float(self.__config.get("temperature", 0))
         num_predict = int(self.__config.get("num_predict", 500))
+        stream = bool(self.__config.get("stream", True))
 
-        user_input = {"query": user_request, "candidates": self.__candidates}
-        user_input_json = json.dumps(user_input, ensure_ascii=False)
+        cache_key = LLMCache.make_key(
+            user_request,
+            ollama_model,
+            prompt.prompt_hash,
+            temperature,
+        )
+        # only deterministic (temperature 0) answers are worth caching
+        use_cache = temperature == 0 and self.__cache.is_enabled()
+        if use_cache:
+            if (cached := await self.__cache.get(cache_key)) is not None:
+                self.__logger.log(
+                    "LLM cache hit, skipping LLM call",
+                    LogLevel.DEBUG,
+                )
+                return self.__get_matcher(prompt).match(ResponseModel(**cached))
 
         if self.__debug:
             self.__logger.log(
                 "Debug mode is enabled, skipping LLM call",
                 LogLevel.DEBUG,
             )
-            return self.__extract_json_block(
+            llm_response = self.__extract_json_block(
                 """
                 ```json
                 {
-                    "status": "ok",
                     "chewiness": 7,
                     "firmness": 6,
-                    "translated": "Delicious sushi with fresh ingredients.",
-                    "best_name": "Sushi Delight",
+                    "translated": "Delicious sushi with fresh ingredients."
                 }
                 ```
                 """
             )
+            return self.__get_matcher(prompt).match(llm_response)
 
-        response = self.__client.chat(
-            model=ollama_model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_input_json},
-            ],
-            options={
+        content = await self.__dispatcher.chat(
+            cache_key,
+            ollama_model,
+            prompt.build_messages(user_request),
+            {
                 "temperature": temperature,
                 "num_predict": num_predict,
             },
+            stream=stream,
         )
-        return self.__extract_json_block(response["message"]["content"].strip())
+        llm_response = self.__extract_json_block(content.strip())
+        if llm_response.status == "error":
+            return llm_response
+
+        # cache the LLM estimate only; matching is cheap and tracks candidate changes
+        if use_cache:
+            await self.__cache.put(cache_key, llm_response.model_dump())
+
+        return self.__get_matcher(prompt).match(llm_response)
+
+    def get_cache_stats(self) -> dict:
+        return self.__cache.get_stats()
+
+    def get_dispatcher_stats(self) -> dict:
+        return self.__dispatcher.get_stats()
@@ -0,0 +1,215 @@
+import asyncio
+import time
+
+from ollama import AsyncClient
+from pylognet.client import LoggingClient, LogLevel
+
+from llm.stream import JSONObjectScanner
+
+
+class Backend:
+    """
+    A single Ollama endpoint with its own in-flight limit and latency stats.
+    """
+
+    def __init__(self, endpoint: str, max_inflight: int) -> None:
+        self.endpoint = endpoint
+        self.client = AsyncClient(endpoint)
+        self.semaphore = asyncio.Semaphore(max_inflight)
+        self.max_inflight = max_inflight
+        self.waiting = 0
+        self.inflight = 0
+        self.calls = 0
+        self.failed = 0
+        self.latency_total = 0.0
+        self.latency_last = 0.0
+        self.latency_max = 0.0
+        self.streamed = 0
+        self.ttft_total = 0.0
+        self.ttj_total = 0.0
+
+    def get_load(self) -> float:
+        return (self.inflight + self.waiting) / self.max_inflight
+
+    def record(self, latency: float, failed: bool) -> None:
+        self.calls += 1
+        if failed:
+            self.failed += 1
+        self.latency_total += latency
+        self.latency_last = latency
+        self.latency_max = max(self.latency_max, latency)
+
+    def record_stream(self, ttft: float, ttj: float) -> None:
+        self.streamed += 1
+        self.ttft_total += ttft
+        self.ttj_total += ttj
+
+    def get_stats(self) -> dict:
+        return {
+            "endpoint": self.endpoint,
+            "max_inflight": self.max_inflight,
+            "inflight": self.inflight,
+            "waiting": self.waiting,
+            "calls": self.calls,
+            "failed": self.failed,
+            "latency_avg": self.latency_total / self.calls if self.calls else 0.0,
+            "latency_last": self.latency_last,
+            "latency_max": self.latency_max,
+            "streamed": self.streamed,
+            "time_to_first_token_avg": (
+                self.ttft_total / self.streamed if self.streamed else 0.0
+            ),
+            "time_to_json_avg": self.ttj_total / self.streamed if self.streamed else 0.0,
+        }
+
+
+class LLMDispatcher:
+    """
+    Coordinates async chat calls to one or more Ollama endpoints.
+
+    Each endpoint accepts at most `max_inflight` concurrent calls, new calls
+    go to the least loaded endpoint, and concurrent calls with the same key
+    are coalesced into a single request (single-flight).
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        logger: LoggingClient,
+        debug_mode: bool = False,
+    ) -> None:
+        self.__debug = debug_mode
+        self.__logger = logger
+        self.__config = config.get("ollama", {})
+
+        endpoints = config.get("endpoints", {}).get("ollama", "http://localhost:11434")
+        if isinstance(endpoints, str):
+            endpoints = [endpoints]
+        max_inflight = max(1, int(self.__config.get("max_inflight", 1)))
+        self.__backends = [Backend(endpoint, max_inflight) for endpoint in endpoints]
+
+        self.__inflight: dict[str, asyncio.Future] = {}
+        self.__coalesced = 0
+
+    def __pick_backend(self) -> Backend:
+        return min(self.__backends, key=lambda backend: backend.get_load())
+
+    async def __stream(
+        self,
+        backend: Backend,
+        model: str,
+        messages: list[dict],
+        options: dict,
+    ) -> str:
+        """
+        Stream a chat call and stop generation as soon as the first JSON
+        object in the output is closed.
+        """
+        started_at = time.monotonic()
+        ttft = 0.0
+        scanner = JSONObjectScanner()
+        parts = await backend.client.chat(
+            model=model,
+            messages=messages,
+            options=options,
+            stream=True,
+        )
+        try:
+            async for part in parts:
+                content = part["message"]["content"]
+                if not content:
+                    continue
+                if not ttft:
+                    ttft = time.monotonic() - started_at
+
+                if (json_block := scanner.feed(content)) is not None:
+                    ttj = time.monotonic() - started_at
+                    backend.record_stream(ttft, ttj)
+                    self.__logger.log(
+                        f"LLM stream from {backend.endpoint}: first token {ttft:.3f}s, JSON {ttj:.3f}s",
+                        LogLevel.DEBUG,
+                    )
+                    return json_block
+        finally:
+            # closing the stream drops the connection and cancels generation
+            await parts.aclose()
+
+        return scanner.get_text()
+
+    async def __call(
+        self,
+        model: str,
+        messages: list[dict],
+        options: dict,
+        stream: bool,
+    ) -> str:
+        backend = self.__pick_backend()
+        backend.waiting += 1
+        async with backend.semaphore:
+            backend.waiting -= 1
+            backend.inflight += 1
+            started_at = time.monotonic()
+            failed = True
+            try:
+                if stream:
+                    content = await self.__stream(backend, model, messages, options)
+                else:
+                    response = await backend.client.chat(
+                        model=model,
+                        messages=messages,
+                        options=options,
+                    )
+                    content = response["message"]["content"]
+                failed = False
+                return content
+            finally:
+                latency = time.monotonic() - started_at
+                backend.inflight -= 1
+                backend.record(latency, failed)
+                self.__logger.log(
+                    f"LLM call to {backend.endpoint} took {latency:.3f}s",
+                    LogLevel.DEBUG,
+                )
+
+    async def chat(
+        self,
+        key: str,
+        model: str,
+        messages: list[dict],
+        options: dict,
+        stream: bool = False,
+    ) -> str:
+        """
+        Run a chat call, sharing the result with identical concurrent calls.
+
+        Args:
+            key (str): Identifies identical calls; calls with the same key
+                in flight at the same time are coalesced.
+            model (str): The Ollama model name.
+            messages (list[dict]): Chat messages.
+            options (dict): Ollama generation options.
+            stream (bool): Stream the response and stop at the end of the
+                first JSON object.
+
+        Returns:
+            str: The content of the assistant message.
+        """
+        future = self.__inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(
+                self.__call(model, messages, options, stream)
+            )
+            self.__inflight[key] = future
+            future.add_done_callback(lambda _: self.__inflight.pop(key, None))
+        else:
+            self.__coalesced += 1
+
+        # shield so that one cancelled waiter does not cancel the shared call
+        return await asyncio.shield(future)
+
+    def get_stats(self) -> dict:
+        return {
+            "coalesced": self.__coalesced,
+            "inflight_keys": len(self.__inflight),
+            "backends": [backend.get_stats() for backend in self.__backends],
+        }
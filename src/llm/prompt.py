@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import threading
+
+from pylognet.client import LoggingClient, LogLevel
+
+
+class Prompt:
+    """
+    Immutable, precompiled snapshot of the system prompt and candidates.
+
+    The system message and the fixed part of the user message are built
+    once, so every call sends a byte-identical prefix and Ollama can reuse
+    its prompt KV cache between requests. Candidates are matched locally
+    and are not sent to the LLM.
+    """
+
+    __slots__ = (
+        "system_prompt",
+        "prompt_hash",
+        "candidates",
+        "system_message",
+        "user_prefix",
+        "version",
+    )
+
+    def __init__(self, system_prompt: str, candidates: list, version: tuple) -> None:
+        self.system_prompt = system_prompt
+        self.prompt_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+        self.candidates = candidates
+        self.system_message = {"role": "system", "content": system_prompt}
+        self.user_prefix = '{"query": '
+        self.version = version
+
+    def build_messages(self, query: str) -> list[dict]:
+        """
+        Build the chat messages for a single query.
+
+        Args:
+            query (str): The user's request.
+
+        Returns:
+            list[dict]: The system and user messages.
+        """
+        user_input = self.user_prefix + json.dumps(query, ensure_ascii=False) + "}"
+        return [self.system_message, {"role": "user", "content": user_input}]
+
+
+class PromptStore:
+    """
+    Loads, validates and caches the LLM prompt, reloading it only when the
+    prompt file's mtime/size changes. A rejected edit is remembered by its
+    version, so it is reported once and not re-read on every call.
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        logger: LoggingClient,
+        debug_mode: bool = False,
+    ) -> None:
+        self.__debug = debug_mode
+        self.__logger = logger
+        self.__lock = threading.Lock()
+        self.__current: Prompt | None = None
+        # (version, error) of the last prompt that failed to load
+        self.__rejected: tuple[tuple, Exception] | None = None
+
+        ollama_config = config.get("ollama", {})
+        self.__path = ollama_config.get("prompt", "")
+        self.__candidates = ollama_config.get("candidates", [])
+        self.__candidates_hash = hashlib.sha256(
+            json.dumps(self.__candidates, ensure_ascii=False, sort_keys=True).encode(
+                "utf-8"
+            )
+        ).hexdigest()
+
+        try:
+            self.get()
+        except (FileNotFoundError, ValueError) as e:
+            self.__logger.log(f"Failed to load system prompt: {e}", LogLevel.WARNING)
+
+    @staticmethod
+    def __validate_candidates(candidates: list) -> list:
+        if not isinstance(candidates, list) or not candidates:
+            raise ValueError("Candidate list must be a non-empty list")
+
+        names = set()
+        for candidate in candidates:
+            if not isinstance(candidate, dict):
+                raise ValueError(f"Invalid candidate: {candidate!r}")
+            name = candidate.get("name")
+            if not isinstance(name, str) or not name:
+                raise ValueError(f"Candidate without a name: {candidate!r}")
+            if name in names:
+                raise ValueError(f"Duplicate candidate: {name}")
+            names.add(name)
+
+            for key in ("chewiness", "firmness"):
+                value = candidate.get(key)
+                if not isinstance(value, (int, float)) or not 1 <= value <= 10:
+                    raise ValueError(f"Candidate {name} has an invalid {key}: {value!r}")
+
+        return candidates
+
+    def __get_version(self) -> tuple:
+        try:
+            stat = os.stat(self.__path) if self.__path else None
+        except OSError:
+            stat = None
+        if stat is None:
+            return (self.__path, None, None, self.__candidates_hash)
+        return (self.__path, stat.st_mtime_ns, stat.st_size, self.__candidates_hash)
+
+    def __reject(self, current: Prompt | None, error: Exception) -> Prompt:
+        if current is None:
+            if isinstance(error, FileNotFoundError):
+                raise FileNotFoundError(str(error))
+            raise ValueError(str(error))
+        return current
+
+    def get(self) -> Prompt:
+        """
+        Return the current prompt snapshot, reloading it if the file changed.
+        An invalid or missing file keeps the previous snapshot.
+
+        Raises:
+            FileNotFoundError: If the prompt file does not exist and no
+                previous snapshot is available.
+            ValueError: If the prompt or candidates are invalid and no
+                previous snapshot is available.
+        """
+        version = self.__get_version()
+        current = self.__current
+        if current is not None and current.version == version:
+            return current
+        rejected = self.__rejected
+        if rejected is not None and rejected[0] == version:
+            return self.__reject(current, rejected[1])
+
+        with self.__lock:
+            current = self.__current
+            if current is not None and current.version == version:
+                return current
+
+            try:
+                if version[1] is None:
+                    raise FileNotFoundError("System prompt file not found")
+                with open(self.__path, "r", encoding="utf-8") as f:
+                    system_prompt = f.read()
+                if not system_prompt.strip():
+                    raise ValueError("System prompt is empty")
+                candidates = self.__validate_candidates(self.__candidates)
+            except (OSError, UnicodeDecodeError, ValueError) as e:
+                self.__rejected = (version, e)
+                if current is not None:
+                    self.__logger.log(
+                        f"Invalid system prompt, keeping previous version: {e}",
+                        LogLevel.ERROR,
+                    )
+                return self.__reject(current, e)
+
+            self.__rejected = None
+            self.__current = Prompt(system_prompt, candidates, version)
+            self.__logger.log(
+                f"System prompt loaded from {self.__path}",
+                LogLevel.INFO,
+            )
+            return self.__current
@@ -0,0 +1,60 @@
+class JSONObjectScanner:
+    """
+    Incrementally scans text for the first complete top-level JSON object.
+
+    Text can be fed in arbitrary chunks (e.g. streamed tokens); `feed`
+    returns the object's source text as soon as its closing brace arrives,
+    ignoring anything before the opening brace such as a code fence.
+    """
+
+    def __init__(self) -> None:
+        self.__text = ""
+        self.__start = -1
+        self.__depth = 0
+        self.__in_string = False
+        self.__escape = False
+
+    def get_text(self) -> str:
+        return self.__text
+
+    def feed(self, chunk: str) -> str | None:
+        """
+        Feed the next chunk of text.
+
+        Args:
+            chunk (str): The next piece of text.
+
+        Returns:
+            str | None: The complete JSON object text, or None if it has not
+                been closed yet.
+        """
+        offset = len(self.__text)
+        self.__text += chunk
+
+        for i in range(offset, len(self.__text)):
+            ch = self.__text[i]
+            if self.__start < 0:
+                if ch == "{":
+                    self.__start = i
+                    self.__depth = 1
+                continue
+
+            if self.__in_string:
+                if self.__escape:
+                    self.__escape = False
+                elif ch == "\\":
+                    self.__escape = True
+                elif ch == '"':
+                    self.__in_string = False
+                continue
+
+            if ch == '"':
+                self.__in_string = True
+            elif ch == "{":
+                self.__depth += 1
+            elif ch == "}":
+                self.__depth -= 1
+                if self.__depth == 0:
+                    return self.__text[self.__start : i + 1]
+
+        return None
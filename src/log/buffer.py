@@ -0,0 +1,145 @@
+import random
+import threading
+import time
+
+from collections import deque
+from pylognet.client import LoggingClient, LogLevel
+
+
+class BufferedLogger:
+    """
+    Drop-in front for `LoggingClient` that never blocks the caller.
+
+    `log` only appends to a bounded ring buffer; a daemon thread drains it
+    up to `batch_size` records per wakeup and forwards them one by one
+    with `client.log`, which has no batch call. When the server falls
+    behind and the buffer fills past `high_water`, DEBUG/INFO records are
+    sampled down, and once it is full the configured policy decides
+    whether the oldest or the newest records are dropped. WARNING and
+    ERROR records are never sampled.
+    """
+
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    POLICIES = (DROP_OLDEST, DROP_NEWEST)
+
+    # levels that are kept while sampling
+    KEEP = (LogLevel.WARNING, LogLevel.ERROR)
+
+    def __init__(
+        self,
+        config: dict,
+        client: LoggingClient,
+        debug_mode: bool = False,
+    ) -> None:
+        self.__debug = debug_mode
+        self.__client = client
+        self.__config = config.get("logging", {})
+        self.__size = max(1, int(self.__config.get("buffer_size", 4096)))
+        self.__batch_size = max(1, int(self.__config.get("batch_size", 256)))
+        self.__interval = float(self.__config.get("flush_interval", 0.5))
+        self.__high_water = int(
+            self.__size * float(self.__config.get("high_water", 0.75))
+        )
+        self.__sample_rate = float(self.__config.get("sample_rate", 0.1))
+        self.__policy = self.__config.get("policy", BufferedLogger.DROP_OLDEST)
+        if self.__policy not in BufferedLogger.POLICIES:
+            raise ValueError(f"Unknown logging policy: {self.__policy}")
+
+        # deque appends and pops are atomic, so threads may log without a lock
+        self.__buffer: deque[tuple[str, LogLevel]] = deque(
+            maxlen=self.__size if self.__policy == BufferedLogger.DROP_OLDEST else None
+        )
+        self.__wakeup = threading.Event()
+        self.__closed = threading.Event()
+        # counters are updated from any logging thread and the flusher
+        self.__stats_lock = threading.Lock()
+        self.__shipped = 0
+        self.__dropped = 0
+        self.__sampled = 0
+        self.__errors = 0
+        self.__deadline = 0.0
+        self.__flusher = threading.Thread(
+            target=self.__run, name="log-flusher", daemon=True
+        )
+        self.__flusher.start()
+
+    def log(self, message: str, level: LogLevel) -> None:
+        depth = len(self.__buffer)
+        if depth >= self.__high_water and level not in BufferedLogger.KEEP:
+            if random.random() >= self.__sample_rate:
+                with self.__stats_lock:
+                    self.__sampled += 1
+                return
+
+        if depth >= self.__size:
+            # with drop_oldest the deque evicts the head on append
+            with self.__stats_lock:
+                self.__dropped += 1
+            if self.__policy == BufferedLogger.DROP_NEWEST:
+                return
+
+        self.__buffer.append((message, level))
+        if depth + 1 >= self.__batch_size:
+            self.__wakeup.set()
+
+    def __ship(self, limit: int | None = None) -> int:
+        shipped = 0
+        errors = 0
+        while limit is None or shipped < limit:
+            try:
+                message, level = self.__buffer.popleft()
+            except IndexError:
+                break
+            try:
+                self.__client.log(message, level)
+            except Exception:
+                # the log server is the one thing we cannot report to
+                errors += 1
+            shipped += 1
+        with self.__stats_lock:
+            self.__shipped += shipped
+            self.__errors += errors
+        return shipped
+
+    def __run(self) -> None:
+        while not self.__closed.is_set():
+            self.__wakeup.wait(self.__interval)
+            self.__wakeup.clear()
+            while self.__ship(self.__batch_size) == self.__batch_size:
+                if self.__closed.is_set():
+                    break
+
+        # final drain on shutdown, done here so records keep a single sender
+        while self.__buffer and time.monotonic() < self.__deadline:
+            self.__ship(self.__batch_size)
+        with self.__stats_lock:
+            self.__dropped += len(self.__buffer)
+        self.__buffer.clear()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Stop the flusher and let it ship what is still buffered, giving up
+        after `timeout` seconds if the log server does not keep up.
+        """
+        if self.__closed.is_set():
+            return
+
+        self.__deadline = time.monotonic() + timeout
+        self.__closed.set()
+        self.__wakeup.set()
+        # a flusher stuck on the log server past the deadline is a daemon
+        # thread and is abandoned; nothing else ships concurrently with it
+        self.__flusher.join(timeout)
+
+    def get_stats(self) -> dict:
+        with self.__stats_lock:
+            return {
+                "buffered": len(self.__buffer),
+                "buffer_size": self.__size,
+                "policy": self.__policy,
+                "shipped": self.__shipped,
+                "sampled": self.__sampled,
+                "dropped": self.__dropped,
+                "errors": self.__errors,
+            }
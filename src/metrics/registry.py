@@ -0,0 +1,253 @@
+import bisect
+import time
+from typing import Callable
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+# seconds; covers sub-millisecond DB writes up to multi-minute LLM calls
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self.bounds = bounds
+        # one slot per bucket plus +Inf; filled once, only incremented after
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Counter:
+    """
+    Monotonic counter, optionally split by labels.
+    """
+
+    TYPE = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self.__children: dict[tuple[str, ...], _CounterChild] = {}
+        if not labels:
+            self.__default = self.labels()
+
+    def labels(self, *values: str) -> _CounterChild:
+        """
+        The child for a label combination. Callers on hot paths should keep
+        the returned object rather than looking it up every time.
+        """
+        child = self.__children.get(values)
+        if child is None:
+            child = self.__children.setdefault(values, _CounterChild())
+        return child
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.__default.inc(amount)
+
+    def render(self) -> list[str]:
+        return [
+            f"{self.name}_total{_format_labels(self.label_names, values)} {child.value}"
+            for values, child in self.__children.items()
+        ]
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram, optionally split by labels.
+    """
+
+    TYPE = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self.__buckets = tuple(sorted(buckets))
+        self.__children: dict[tuple[str, ...], _HistogramChild] = {}
+        if not labels:
+            self.__default = self.labels()
+
+    def labels(self, *values: str) -> _HistogramChild:
+        child = self.__children.get(values)
+        if child is None:
+            child = self.__children.setdefault(values, _HistogramChild(self.__buckets))
+        return child
+
+    def observe(self, value: float) -> None:
+        self.__default.observe(value)
+
+    def render(self) -> list[str]:
+        lines = []
+        for values, child in self.__children.items():
+            cumulative = 0
+            for bound, count in zip((*self.__buckets, "+Inf"), child.counts):
+                cumulative += count
+                le = _format_labels(self.label_names, values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.label_names, values)
+            lines.append(f"{self.name}_sum{labels} {child.sum}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Gauge:
+    """
+    Value sampled at scrape time from a callback, which returns either a
+    number or a mapping of label value tuples to numbers.
+    """
+
+    TYPE = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], float | dict[tuple[str, ...], float]],
+        labels: tuple[str, ...] = (),
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self.__callback = callback
+
+    def render(self) -> list[str]:
+        value = self.__callback()
+        if not isinstance(value, dict):
+            return [f"{self.name} {value}"]
+
+        return [
+            f"{self.name}{_format_labels(self.label_names, values)} {sample}"
+            for values, sample in value.items()
+        ]
+
+
+class MetricsRegistry:
+    """
+    In-process metrics rendered in the Prometheus text exposition format.
+
+    Metrics are plain Python counters updated on the event loop or under
+    the GIL; recording an observation only increments preallocated slots.
+    """
+
+    def __init__(self) -> None:
+        self.__metrics: dict[str, Counter | Histogram | Gauge] = {}
+
+    def __register(self, metric):
+        if metric.name in self.__metrics:
+            return self.__metrics[metric.name]
+        self.__metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self.__register(Counter(name, documentation, labels))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.__register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], float | dict[tuple[str, ...], float]],
+        labels: tuple[str, ...] = (),
+    ) -> Gauge:
+        # re-registering replaces the callback, e.g. for a new App instance
+        metric = Gauge(name, documentation, callback, labels)
+        self.__metrics[name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.__metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ("method", "route", "status"),
+)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording one HTTP_REQUESTS observation per request,
+    labelled with the matched route template rather than the raw path.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.__app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.__app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.__app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUESTS.labels(
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                str(status),
+            ).observe(time.perf_counter() - start)
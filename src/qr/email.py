@@ -1,7 +1,9 @@
 import base64
+import json
 import os
+import time
 
-from fastapi import HTTPException
+import httplib2
 
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -9,11 +11,55 @@ from email.mime.image import MIMEImage
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 
 from pylognet.client import LoggingClient, LogLevel
 
+from metrics.registry import REGISTRY
+
+SEND_SECONDS = REGISTRY.histogram(
+    "email_send_seconds", "EmailSender.send_email latency by outcome", ("outcome",)
+)
+
+
+class EmailSendError(Exception):
+    """
+    Raised when a message could not be sent.
+
+    Attributes:
+        retryable (bool): Whether sending again later may succeed, e.g. on
+            rate limiting, server errors or network failures.
+    """
+
+    def __init__(self, message: str, retryable: bool) -> None:
+        super().__init__(message)
+        self.retryable = retryable
+
+
+# Gmail reports sending quota limits as 403 with one of these reasons
+RETRYABLE_REASONS = frozenset(
+    ("rateLimitExceeded", "userRateLimitExceeded", "backendError")
+)
+
+
+def _get_reasons(error: HttpError) -> set[str]:
+    try:
+        content = json.loads(error.content)
+        errors = content.get("error", {}).get("errors", [])
+        return {e.get("reason", "") for e in errors if isinstance(e, dict)}
+    except (ValueError, TypeError, AttributeError):
+        return set()
+
+
+def _is_retryable(error: HttpError) -> bool:
+    status = error.resp.status
+    if status == 429 or status >= 500:
+        return True
+    return bool(_get_reasons(error) & RETRYABLE_REASONS)
+
 
 class EmailSender:
     TEST_QR_CODE = "iVBORw0KGgoAAAANSUhEUgAAADYAAAA2AQMAAAC2i/ieAAAABlBMVEX///8AAABVwtN+AAAACXBIWXMAAA7EAAAOxAGVKw4bAAAAeUlEQVQYlZXNMQoEMQiF4Qe2Aa8i2Aa8+oJtYK4SsB1wltlAnO3mb77KJ/AyyjDLIqQLFU2HxkP/sz2E5Lr/maFr//Ybr9e3dGp6FJlz8hZdO3JL07vxFqHaZhE05NhSzqNJESKsRZNIr2qz86F3FKEYUsz4eNu+7AJ7EFg5FDUcHwAAAABJRU5ErkJggg=="
@@ -34,7 +80,10 @@ class EmailSender:
             return None
 
         token_path = self.__config.get("token", "./settings/token.json")
-        creds_path = self.__config.get("credentials", "./settings/credentials.json")
+        creds_path = self.__config.get(
+            "credential",
+            self.__config.get("credentials", "./settings/credentials.json"),
+        )
         scopes = self.__config.get(
             "scopes", ["https://www.googleapis.com/auth/gmail.send"]
         )
@@ -49,9 +98,22 @@ class EmailSender:
                 creds = flow.run_local_server(port=0)
             with open(token_path, "w") as token:
                 token.write(creds.to_json())
-        return build("gmail", "v1", credentials=creds)
+        # one authorized transport for the lifetime of the sender; it refreshes
+        # the token itself, so sends do not re-authorize or reconnect
+        http = AuthorizedHttp(
+            creds, http=httplib2.Http(timeout=float(self.__config.get("timeout", 30)))
+        )
+        return build("gmail", "v1", http=http, cache_discovery=False)
 
     def send_email(self, to: str, qr_code: str, uuid: str):
+        """
+        Send the QR code mail to a user. The underlying transport is not
+        thread-safe, so calls must not overlap.
+
+        Raises:
+            EmailSendError: If the Gmail API rejected the message or could
+                not be reached.
+        """
         if self.__debug or self.__service is None:
             return
 
@@ -78,9 +140,15 @@ class EmailSender:
         encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
         body = {"raw": encoded_message}
 
+        start = time.perf_counter()
+        outcome = "error"
         try:
             _ = self.__service.users().messages().send(userId="me", body=body).execute()
+            outcome = "sent"
             self.__logger.log(f"Email sent to {to} with QR code.", LogLevel.INFO)
-        except Exception as e:
-            self.__logger.log(f"Failed to send email to {to}: {e}", LogLevel.ERROR)
-            raise HTTPException(status_code=500, detail=str(e))
+        except HttpError as e:
+            raise EmailSendError(str(e), _is_retryable(e)) from e
+        except (OSError, httplib2.HttpLib2Error) as e:
+            raise EmailSendError(str(e), True) from e
+        finally:
+            SEND_SECONDS.labels(outcome).observe(time.perf_counter() - start)
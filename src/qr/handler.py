@@ -1,11 +1,29 @@
+import asyncio
 import qrcode
 import base64
+import time
 
 from io import BytesIO
+from PIL import Image
 from pylognet.client import LoggingClient, LogLevel
+from qrcode import constants, util
+from qrcode.exceptions import DataOverflowError
+
+from metrics.registry import REGISTRY
+
+QR_SECONDS = REGISTRY.histogram(
+    "qr_generate_seconds", "QRHandler.generate_qr latency"
+)
 
 
 class QRHandler:
+    ERROR_CORRECTION = {
+        "L": constants.ERROR_CORRECT_L,
+        "M": constants.ERROR_CORRECT_M,
+        "Q": constants.ERROR_CORRECT_Q,
+        "H": constants.ERROR_CORRECT_H,
+    }
+
     def __init__(
         self,
         config: dict,
@@ -15,31 +33,105 @@ class QRHandler:
         self.__debug = debug_mode
         self.__logger = logger
         self.__config = config.get("qr", {})
+        self.__box_size = int(self.__config.get("box_size", 10))
+        self.__border = int(self.__config.get("border", 5))
+        self.__error_correction = QRHandler.ERROR_CORRECTION[
+            self.__config.get("error_correction", "M")
+        ]
+        # evaluating all 8 masks dominates encoding time; a fixed mask (0-7)
+        # skips that search at the cost of a slightly less optimal pattern
+        self.__mask_pattern = self.__config.get("mask_pattern")
+        # UUIDs always have the same length and character mode, so the
+        # version found by the fit search for the first such payload is reused
+        self.__versions: dict[tuple[int, int], int] = {}
+
+    def __make_qr(self, data: str, version: int | None) -> qrcode.QRCode:
+        qr = qrcode.QRCode(
+            version=version,
+            error_correction=self.__error_correction,
+            border=self.__border,
+            mask_pattern=self.__mask_pattern,
+        )
+        qr.add_data(data)
+        qr.make(fit=version is None)
+        return qr
+
+    def __make_matrix(self, data: str) -> list[list[bool]]:
+        key = (len(data), util.optimal_mode(data.encode("utf-8")))
+        version = self.__versions.get(key)
+        try:
+            qr = self.__make_qr(data, version)
+        except DataOverflowError:
+            # mixed-mode segments of this payload need more room than the
+            # cached version offers
+            qr = self.__make_qr(data, None)
+        self.__versions.setdefault(key, qr.version)
+        return qr.get_matrix()
+
+    def __encode_png(self, matrix: list[list[bool]]) -> bytes:
+        size = len(matrix)
+        # 1-bit image: 0 is black, 255 is white
+        modules = Image.new("1", (size, size))
+        modules.putdata([0 if dark else 255 for row in matrix for dark in row])
+        scaled = modules.resize(
+            (size * self.__box_size, size * self.__box_size), Image.Resampling.NEAREST
+        )
+        buf = BytesIO()
+        scaled.save(buf, format="PNG")
+        return buf.getvalue()
+
+    def render_png(self, user_id: str) -> bytes:
+        """
+        Render the QR code for a user as a compact 1-bit PNG.
+        """
+        return self.__encode_png(self.__make_matrix(user_id))
+
+    def render_svg(self, user_id: str) -> str:
+        """
+        Render the QR code for a user as a scalable SVG document.
+        """
+        matrix = self.__make_matrix(user_id)
+        size = len(matrix)
+        path = "".join(
+            f"M{x},{y}h1v1h-1z"
+            for y, row in enumerate(matrix)
+            for x, dark in enumerate(row)
+            if dark
+        )
+        return (
+            '<svg xmlns="http://www.w3.org/2000/svg" '
+            f'viewBox="0 0 {size} {size}" '
+            f'width="{size * self.__box_size}" height="{size * self.__box_size}" '
+            'shape-rendering="crispEdges">'
+            f'<rect width="{size}" height="{size}" fill="#fff"/>'
+            f'<path d="{path}" fill="#000"/></svg>'
+        )
 
     def generate_qr(self, user_id: str) -> tuple[str, BytesIO]:
         """
         Generate a QR code for the given item uuid and return it as a base64-encoded string.
 
+        The PNG is encoded once and shared by both return values.
+
         Args:
-            item (Item): An instance of Item containing uuid and request.
+            user_id (str): The user's UUID.
+
+        Returns:
+            tuple[str, BytesIO]: The base64-encoded PNG and the PNG itself.
         """
         self.__logger.log(
             f"Generating QR code for User ID: {user_id}",
             LogLevel.INFO,
         )
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
+        start = time.perf_counter()
+        png = self.render_png(user_id)
+        qr_code_base64 = base64.b64encode(png).decode("utf-8")
+        QR_SECONDS.observe(time.perf_counter() - start)
 
-        qr.add_data(user_id)
-        qr.make(fit=True)
+        return qr_code_base64, BytesIO(png)
 
-        img = qr.make_image(fill_color="black", back_color="white")
-        buf = BytesIO()
-        img.save(buf, format="PNG")
-        buf.seek(0)
-        img_buf = BytesIO()
-        img.save(img_buf, format="PNG")
-        img_buf.seek(0)
-        qr_code_base64 = base64.b64encode(buf.read()).decode("utf-8")
-        buf.close()
-
-        return qr_code_base64, img_buf
+    async def generate(self, user_id: str) -> tuple[str, BytesIO]:
+        """
+        `generate_qr` run off the event loop.
+        """
+        return await asyncio.to_thread(self.generate_qr, user_id)
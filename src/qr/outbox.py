@@ -0,0 +1,314 @@
+import asyncio
+import heapq
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from pylognet.client import LoggingClient, LogLevel
+
+from db.controller import DataBase
+from qr.email import EmailSender, EmailSendError
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, up to `burst` at once.
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.__rate = rate
+        self.__burst = burst
+        self.__tokens = float(burst)
+        self.__updated = time.monotonic()
+
+    def __refill(self) -> None:
+        now = time.monotonic()
+        self.__tokens = min(
+            self.__burst, self.__tokens + (now - self.__updated) * self.__rate
+        )
+        self.__updated = now
+
+    async def acquire(self) -> None:
+        self.__refill()
+        while self.__tokens < 1:
+            await asyncio.sleep((1 - self.__tokens) / self.__rate)
+            self.__refill()
+        self.__tokens -= 1
+
+    def get_tokens(self) -> float:
+        self.__refill()
+        return self.__tokens
+
+
+class EmailOutbox:
+    """
+    Durable queue of QR code mails in front of EmailSender.
+
+    Entries are stored in `<db>/outbox.db` keyed by UUID, so a user is
+    mailed at most once and nothing is lost across restarts. A single
+    worker drains due entries at the rate allowed by a token bucket and
+    retries transient failures with exponential backoff.
+    """
+
+    PENDING = "pending"
+    SENT = "sent"
+    DEAD = "dead"
+
+    def __init__(
+        self,
+        config: dict,
+        sender: EmailSender,
+        db: DataBase,
+        logger: LoggingClient,
+        debug_mode: bool = False,
+    ) -> None:
+        self.__debug = debug_mode
+        self.__sender = sender
+        self.__db = db
+        self.__logger = logger
+        self.__config = config.get("email", {}).get("outbox", {})
+        # Gmail allows roughly 2.5 messages.send calls per second per user
+        self.__bucket = TokenBucket(
+            float(self.__config.get("rate", 2.0)), int(self.__config.get("burst", 5))
+        )
+        self.__max_attempts = int(self.__config.get("max_attempts", 8))
+        self.__backoff = float(self.__config.get("backoff", 5))
+        self.__max_backoff = float(self.__config.get("max_backoff", 3600))
+        self.__path = os.path.join(db.get_path(), "outbox.db")
+
+        self.__conn = sqlite3.connect(self.__path, check_same_thread=False)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        self.__conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "uuid TEXT PRIMARY KEY, email TEXT NOT NULL, status TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL, "
+            "created_at REAL NOT NULL, last_error TEXT NOT NULL DEFAULT '')"
+        )
+        self.__conn.commit()
+        # the connection is shared by to_thread workers
+        self.__lock = threading.Lock()
+
+        # (next_attempt, uuid, email, attempts) of pending entries
+        self.__due: list[tuple[float, str, str, int]] = []
+        # every UUID in the outbox, so enqueue can dedupe without a query
+        self.__known: set[str] = set()
+        # INSERTs not yet committed, awaited before the entry is sent
+        self.__writes: dict[str, asyncio.Task] = {}
+        self.__wakeup = asyncio.Event()
+        self.__worker: asyncio.Task | None = None
+        # the Gmail transport is not thread-safe; keep all sends on one thread
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="email")
+        self.__sent = 0
+        self.__failed = 0
+
+    def __del__(self):
+        self.__conn.close()
+
+    def __load(self) -> tuple[list[tuple], set[str]]:
+        with self.__lock:
+            pending = self.__conn.execute(
+                "SELECT next_attempt, uuid, email, attempts FROM outbox "
+                "WHERE status = ?",
+                (EmailOutbox.PENDING,),
+            ).fetchall()
+            known = {row[0] for row in self.__conn.execute("SELECT uuid FROM outbox")}
+        return pending, known
+
+    async def start(self) -> None:
+        if self.__worker is not None:
+            return
+
+        pending, self.__known = await asyncio.to_thread(self.__load)
+        self.__due = [tuple(row) for row in pending]
+        heapq.heapify(self.__due)
+        if self.__due:
+            self.__logger.log(
+                f"Resuming {len(self.__due)} pending emails", LogLevel.INFO
+            )
+        self.__worker = asyncio.create_task(self.__run())
+
+    async def stop(self) -> None:
+        if self.__worker is None:
+            return
+
+        self.__worker.cancel()
+        await asyncio.gather(
+            self.__worker, *self.__writes.values(), return_exceptions=True
+        )
+        self.__worker = None
+        await asyncio.to_thread(self.__executor.shutdown, True)
+
+    def __insert(self, user_id: str, email: str, now: float) -> None:
+        with self.__lock, self.__conn:
+            self.__conn.execute(
+                "INSERT OR IGNORE INTO outbox "
+                "(uuid, email, status, next_attempt, created_at) VALUES (?, ?, ?, ?, ?)",
+                (user_id, email, EmailOutbox.PENDING, now, now),
+            )
+
+    def enqueue(self, user_id: str, email: str) -> bool:
+        """
+        Queue the QR code mail for a user. The row is written in the
+        background; the worker waits for it before sending.
+
+        Args:
+            user_id (str): The user's UUID.
+            email (str): Recipient address.
+
+        Returns:
+            bool: False if a mail for this user was already queued or sent.
+        """
+        if user_id in self.__known:
+            return False
+
+        now = time.time()
+        self.__known.add(user_id)
+        write = asyncio.create_task(
+            asyncio.to_thread(self.__insert, user_id, email, now)
+        )
+        self.__writes[user_id] = write
+        write.add_done_callback(lambda _: self.__writes.pop(user_id, None))
+
+        heapq.heappush(self.__due, (now, user_id, email, 0))
+        self.__wakeup.set()
+        return True
+
+    def __deliver(self, user_id: str, email: str) -> None:
+        user = self.__db.get_user(user_id)
+        qr_code = user.get_qr_code() if user is not None else ""
+        if not qr_code:
+            raise EmailSendError(f"QR code missing for {user_id}", False)
+
+        self.__sender.send_email(email, qr_code, user_id)
+
+    def __finish(self, user_id: str, status: str, attempts: int, error: str = "") -> None:
+        with self.__lock, self.__conn:
+            self.__conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, last_error = ? WHERE uuid = ?",
+                (status, attempts, error, user_id),
+            )
+
+    def __reschedule(
+        self, user_id: str, attempts: int, next_attempt: float, error: str
+    ) -> None:
+        with self.__lock, self.__conn:
+            self.__conn.execute(
+                "UPDATE outbox SET attempts = ?, next_attempt = ?, last_error = ? "
+                "WHERE uuid = ?",
+                (attempts, next_attempt, error, user_id),
+            )
+
+    async def __retry(
+        self, user_id: str, email: str, attempts: int, error: str
+    ) -> None:
+        delay = min(self.__max_backoff, self.__backoff * 2 ** (attempts - 1))
+        next_attempt = time.time() + delay * random.uniform(0.8, 1.2)
+        heapq.heappush(self.__due, (next_attempt, user_id, email, attempts))
+        try:
+            await asyncio.to_thread(
+                self.__reschedule, user_id, attempts, next_attempt, error
+            )
+        except Exception as e:
+            # the entry is already queued again; only the stored schedule is stale
+            self.__logger.log(
+                f"Failed to reschedule email to {user_id}: {e}", LogLevel.ERROR
+            )
+
+    async def __record(
+        self, user_id: str, status: str, attempts: int, error: str = ""
+    ) -> None:
+        try:
+            await asyncio.to_thread(self.__finish, user_id, status, attempts, error)
+        except Exception as e:
+            # the outcome stands even if it cannot be stored; queueing the
+            # entry again would mail the user twice
+            self.__logger.log(
+                f"Failed to record email to {user_id} as {status}: {e}", LogLevel.ERROR
+            )
+
+    async def __send(self, user_id: str, email: str, attempts: int) -> None:
+        if (write := self.__writes.get(user_id)) is not None:
+            await write
+        attempts += 1
+
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.__executor, self.__deliver, user_id, email)
+        except Exception as e:
+            # anything but an explicit rejection (e.g. a failed token
+            # refresh) is treated as transient
+            retryable = e.retryable if isinstance(e, EmailSendError) else True
+            if retryable and attempts < self.__max_attempts:
+                self.__logger.log(
+                    f"Email to {user_id} failed (attempt {attempts}), retrying: {e}",
+                    LogLevel.WARNING,
+                )
+                await self.__retry(user_id, email, attempts, str(e))
+                return
+
+            self.__logger.log(f"Giving up on email to {user_id}: {e}", LogLevel.ERROR)
+            self.__failed += 1
+            await self.__record(user_id, EmailOutbox.DEAD, attempts, str(e))
+            return
+
+        self.__sent += 1
+        await self.__record(user_id, EmailOutbox.SENT, attempts)
+
+    async def __run(self) -> None:
+        while True:
+            if not self.__due:
+                await self.__wakeup.wait()
+                self.__wakeup.clear()
+                continue
+
+            delay = self.__due[0][0] - time.time()
+            if delay > 0:
+                self.__wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.__wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # drain everything that is due as fast as the bucket allows
+            await self.__bucket.acquire()
+            _, user_id, email, attempts = heapq.heappop(self.__due)
+            try:
+                await self.__send(user_id, email, attempts)
+            except Exception as e:
+                # nothing was sent (e.g. the row could not be written);
+                # keep the worker alive and try the entry again later
+                self.__logger.log(
+                    f"Unexpected error sending email to {user_id}: {e}", LogLevel.ERROR
+                )
+                heapq.heappush(
+                    self.__due, (time.time() + self.__backoff, user_id, email, attempts)
+                )
+
+    def __count(self) -> dict[str, int]:
+        with self.__lock:
+            return dict(
+                self.__conn.execute(
+                    "SELECT status, COUNT(*) FROM outbox GROUP BY status"
+                ).fetchall()
+            )
+
+    def get_pending(self) -> int:
+        """Mails queued in memory and not yet sent or given up on."""
+        return len(self.__due)
+
+    async def get_stats(self) -> dict:
+        counts = await asyncio.to_thread(self.__count)
+        return {
+            "pending": counts.get(EmailOutbox.PENDING, 0),
+            "sent": counts.get(EmailOutbox.SENT, 0),
+            "dead": counts.get(EmailOutbox.DEAD, 0),
+            "due": sum(1 for entry in self.__due if entry[0] <= time.time()),
+            "tokens": round(self.__bucket.get_tokens(), 2),
+            "sent_since_start": self.__sent,
+            "failed_since_start": self.__failed,
+        }
@@ -0,0 +1,263 @@
+import asyncio
+import json
+import os
+import re
+import secrets
+import time
+
+from collections import OrderedDict
+from pylognet.client import LoggingClient, LogLevel
+
+from db.controller import DataBase
+
+
+class SpanContext:
+    """
+    Trace and span id pair, carried between services as a W3C
+    `traceparent` value (`00-<trace_id>-<span_id>-01`).
+    """
+
+    __slots__ = ("trace_id", "span_id")
+
+    TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+    def __init__(self, trace_id: str, span_id: str) -> None:
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+    def to_traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    @staticmethod
+    def from_traceparent(value: str | None) -> "SpanContext | None":
+        if not value:
+            return None
+        match = SpanContext.TRACEPARENT.match(value.strip().lower())
+        if match is None:
+            return None
+        trace_id, span_id = match.groups()
+        if trace_id == "0" * 32 or span_id == "0" * 16:
+            return None
+        return SpanContext(trace_id, span_id)
+
+
+class Span:
+    """
+    One timed operation of a trace. Use as a context manager, or call
+    `end()` for spans that outlive a single block.
+    """
+
+    __slots__ = (
+        "name",
+        "context",
+        "parent_id",
+        "start",
+        "attributes",
+        "status",
+        "__tracer",
+        "__started",
+        "__ended",
+    )
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent_id: str | None,
+        attributes: dict,
+    ) -> None:
+        self.name = name
+        self.context = SpanContext(trace_id, secrets.token_hex(8))
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.attributes = attributes
+        self.status = "ok"
+        self.__tracer = tracer
+        self.__started = time.perf_counter()
+        self.__ended = False
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def end(self, status: str | None = None) -> None:
+        if self.__ended:
+            return
+        self.__ended = True
+        if status is not None:
+            self.status = status
+        self.__tracer.record(
+            {
+                "trace_id": self.context.trace_id,
+                "span_id": self.context.span_id,
+                "parent_id": self.parent_id,
+                "name": self.name,
+                "start": self.start,
+                "duration": time.perf_counter() - self.__started,
+                "status": self.status,
+                "attributes": self.attributes,
+            }
+        )
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.attributes.setdefault("error", repr(exc))
+            self.end("error")
+        else:
+            self.end()
+
+
+class JSONLExporter:
+    """
+    Appends finished span records to a file, one JSON object per line.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.__path = path
+
+    def export(self, records: list[dict]) -> None:
+        lines = "".join(
+            json.dumps(record, ensure_ascii=False, default=str) + "\n"
+            for record in records
+        )
+        with open(self.__path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+class Tracer:
+    """
+    Ties the hops of one dish request together.
+
+    `/request` opens a root span per user; later spans
+    for that user (LLM, generator calls, asset callbacks) attach to it by
+    UUID, since those run as separate scheduler jobs. The root context is
+    what the generators receive as `traceparent` and send back on
+    `/save/*`. Finished spans are buffered and written by a background
+    task, so recording one never touches the disk on the request path.
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        db: DataBase,
+        logger: LoggingClient,
+        debug_mode: bool = False,
+    ) -> None:
+        self.__debug = debug_mode
+        self.__logger = logger
+        self.__config = config.get("tracing", {})
+        self.__enabled = bool(self.__config.get("enabled", True))
+        self.__interval = float(self.__config.get("flush_interval", 1.0))
+        self.__max_pending = int(self.__config.get("max_pending", 10000))
+        self.__max_traces = int(self.__config.get("max_traces", 4096))
+        path = self.__config.get("path")
+        self.__exporter = JSONLExporter(
+            os.path.expanduser(path)
+            if path
+            else os.path.join(db.get_path(), "traces.jsonl")
+        )
+
+        # user_id -> open root span, oldest first
+        self.__roots: OrderedDict[str, Span] = OrderedDict()
+        self.__pending: list[dict] = []
+        self.__dropped = 0
+        self.__exported = 0
+        self.__flusher: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self.__enabled and self.__flusher is None:
+            self.__flusher = asyncio.create_task(self.__run())
+
+    async def stop(self) -> None:
+        if self.__flusher is not None:
+            self.__flusher.cancel()
+            await asyncio.gather(self.__flusher, return_exceptions=True)
+            self.__flusher = None
+        for root in list(self.__roots.values()):
+            root.end("unfinished")
+        self.__roots.clear()
+        await self.__flush()
+
+    async def __run(self) -> None:
+        while True:
+            await asyncio.sleep(self.__interval)
+            await self.__flush()
+
+    async def __flush(self) -> None:
+        if not self.__pending:
+            return
+
+        records, self.__pending = self.__pending, []
+        try:
+            await asyncio.to_thread(self.__exporter.export, records)
+            self.__exported += len(records)
+        except OSError as e:
+            self.__dropped += len(records)
+            self.__logger.log(f"Failed to export spans: {e}", LogLevel.ERROR)
+
+    def record(self, record: dict) -> None:
+        if not self.__enabled:
+            return
+        if len(self.__pending) >= self.__max_pending:
+            self.__dropped += 1
+            return
+        self.__pending.append(record)
+
+    def start_trace(self, name: str, **attributes) -> Span:
+        """
+        Open a root span. Bind it to a user with `bind` once the UUID is
+        known; it then stays open until `end_trace` is called for the user.
+        """
+        return Span(self, name, secrets.token_hex(16), None, attributes)
+
+    def bind(self, user_id: str, root: Span) -> None:
+        root.set_attribute("user_id", user_id)
+        self.__roots[user_id] = root
+        while len(self.__roots) > self.__max_traces:
+            _, oldest = self.__roots.popitem(last=False)
+            oldest.end("evicted")
+
+    def end_trace(self, user_id: str, status: str = "ok", **attributes) -> None:
+        if (root := self.__roots.pop(user_id, None)) is not None:
+            root.attributes.update(attributes)
+            root.end(status)
+
+    def get_context(self, user_id: str) -> SpanContext | None:
+        root = self.__roots.get(user_id)
+        return root.context if root is not None else None
+
+    def span(
+        self,
+        name: str,
+        user_id: str,
+        parent: SpanContext | None = None,
+        **attributes,
+    ) -> Span:
+        """
+        Start a span in a user's trace.
+
+        Args:
+            name (str): Operation name, e.g. "generator.model".
+            user_id (str): The user's UUID.
+            parent (SpanContext | None): Explicit parent, e.g. parsed from an
+                incoming `traceparent`. Defaults to the user's root span; a
+                user without a trace gets a new one.
+        """
+        if parent is None:
+            parent = self.get_context(user_id)
+        attributes = {"user_id": user_id, **attributes}
+        if parent is None:
+            return Span(self, name, secrets.token_hex(16), None, attributes)
+        return Span(self, name, parent.trace_id, parent.span_id, attributes)
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.__enabled,
+            "open_traces": len(self.__roots),
+            "pending": len(self.__pending),
+            "exported": self.__exported,
+            "dropped": self.__dropped,
+        }